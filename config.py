@@ -171,6 +171,8 @@ class Config(object):
   train = Flag.boolean(True, 'Whether this is a training task')
   smart_train = Flag.boolean(False, 'Whether to use smart trainer', is_key=None)
   save_model = Flag.boolean(True, 'Whether to save model during training')
+  async_save = Flag.boolean(
+    False, 'Whether to write checkpoints on a background thread', is_key=None)
   overwrite = Flag.boolean(False, 'Whether to overwrite records')
   export_note = Flag.boolean(False, 'Whether to take notes')
   summary = Flag.boolean(True, 'Whether to write summary')
@@ -205,6 +207,8 @@ class Config(object):
   allow_growth = Flag.boolean(True, 'tf.ConfigProto().gpu_options.allow_growth')
   gpu_memory_fraction = Flag.float(
     0.4, 'config.gpu_options.per_process_gpu_memory_fraction')
+  intra_op_threads = Flag.integer(
+    0, 'config.intra_op_parallelism_threads, decided by tensorflow if 0')
 
   # Configs usually provided during method calling
   mark = Flag.string(None, 'Model identifier')
@@ -221,8 +225,49 @@ class Config(object):
                              is_key=None)
   output_gate = Flag.boolean(True, 'Whether to use output gate in LSTM',
                              is_key=None)
+  max_streams = Flag.integer(
+    1024, 'Maximum number of stream states kept in streaming inference')
   val_preheat = Flag.integer(0, 'metric = metric_batch[val_preheat:].mean')
   val_batch_size = Flag.integer(None, 'Batch size in batch validation')
+  prefetch_depth = Flag.integer(
+    0, 'Number of batches prepared in advance on a background thread. '
+       'Prefetching is off when this value is 0', is_key=None)
+  fused_steps = Flag.integer(
+    1, 'Number of optimizer steps run inside a single session call. Should '
+       'be set before model is built', is_key=None)
+  accumulation_steps = Flag.integer(
+    1, 'Number of micro-batches over which gradients are accumulated before '
+       'being applied. Should be set before model is built', is_key=None)
+  resident_data = Flag.boolean(
+    False, 'Whether to keep training set inside graph so that batches are '
+           'gathered without being fed. Should be set before model is built',
+    is_key=None)
+  data_pipeline = Flag.boolean(
+    False, 'Whether to read training batches from a tf.data pipeline. Should '
+           'be set before model is built', is_key=None)
+  num_parallel_calls = Flag.integer(
+    1, 'Number of BigData files loaded in parallel by data pipeline. Other '
+       'data are read sequentially from their batch generators', is_key=None)
+  pipeline_cache = Flag.string(
+    None, 'BigData files loaded by pipeline will be cached in memory if this '
+          'value is an empty string, or in the given file. No cache if None',
+    is_key=None)
+  scan_workers = Flag.integer(
+    1, 'Number of processes scanning BigData files. Files are scanned in '
+       'main process if this value is 1, and by CPU count processes if 0',
+    is_key=None)
+  fused_rnn = Flag.boolean(
+    False, 'Whether to run built-in rnn cells layer by layer, with input '
+           'projections of all time steps calculated before recurrence. '
+           'Should be set before model is built', is_key=None)
+  state_in_graph = Flag.boolean(
+    False, 'Whether to carry rnn states between training steps in graph '
+           'variables instead of fetching and feeding them. Should be set '
+           'before model is built', is_key=None)
+  bucket_batches = Flag.boolean(
+    False, 'Whether to batch irregular sequences of similar lengths together '
+           'for recurrent models. Sequences are padded and masked. Should be '
+           'set before model is built', is_key=None)
   with_peepholes = Flag.boolean(False, 'Whether to add peepholes in LSTM',
                                 is_key=None)
   neurons_per_unit = Flag.integer(3, '...', is_key=None)
@@ -341,6 +386,14 @@ class Config(object):
       self.monitor_preact = self.monitor
       self.monitor_postact = self.monitor
 
+    # Activations inside fused training loops can not be monitored
+    if self.monitor_preact or self.monitor_postact: self.fused_steps = 1
+    # Resident or pipeline batches are not fed thus can not be stacked for
+    # .. fused steps
+    if self.resident_data or self.data_pipeline: self.fused_steps = 1
+    # Fused steps apply gradients directly
+    if self.accumulation_steps > 1: self.fused_steps = 1
+
   def get_attr(self, name):
     return object.__getattribute__(self, name)
 
@@ -18,6 +18,8 @@ from tframe.utils.local import check_path, clear_paths, write_file
 from tframe.utils.local import save_checkpoint, load_checkpoint
 
 from tframe.core.decorators import with_graph
+from tframe.core.checkpoint import CheckpointWriter
+from tframe.core.mirror import VariableMirror
 
 
 class Agent(object):
@@ -35,6 +37,8 @@ class Agent(object):
     # An agent saves model and writes summary
     self._saver = None
     self._summary_writer = None
+    # Checkpoints may be written on a background thread
+    self._ckpt_writer = None
     # An agent holds a default note
     self._note = Note()
 
@@ -104,9 +108,24 @@ class Agent(object):
     if not hub.save_model and hub.overwrite: return False, 0
     return load_checkpoint(self.ckpt_dir, self.session, self._saver)
 
-  def save_model(self):
-    save_checkpoint(self.model_path, self.session, self._saver,
-                    self._model.counter)
+  def save_model(self, session=None, counter=None):
+    """Save model. Variables in a shadow session of the same graph can be
+       saved by providing session and the corresponding counter"""
+    if session is None: session = self.session
+    if counter is None: counter = self._model.counter
+    if not hub.async_save:
+      save_checkpoint(self.model_path, session, self._saver, counter)
+      return
+    # Take a snapshot and write it in background
+    if self._ckpt_writer is None:
+      with self.graph.as_default(): variables = self._model.variable_to_save
+      self._ckpt_writer = CheckpointWriter(
+        self.graph, self._saver, variables, self.create_session)
+    self._ckpt_writer.save(self.model_path, session, counter)
+
+  def flush_checkpoints(self):
+    """Block until all checkpoints scheduled have been written"""
+    if self._ckpt_writer is not None: self._ckpt_writer.flush()
 
   @with_graph
   def launch_model(self, overwrite=False):
@@ -123,11 +142,7 @@ class Agent(object):
 
     # Launch session on self.graph
     console.show_status('Launching session ...')
-    config = tf.ConfigProto()
-    if not hub.allow_growth:
-      value = hub.gpu_memory_fraction
-      config.gpu_options.per_process_gpu_memory_fraction = value
-    self._session = tf.Session(graph=self._graph, config=config)
+    self._session = self.create_session()
     console.show_status('Session launched')
     # Prepare some tools
     self._saver = tf.train.Saver(var_list=self._model.variable_to_save)
@@ -153,7 +168,28 @@ class Agent(object):
     self.take_notes('Model launched')
     return load_flag
 
+  def create_session(self):
+    """Create a session on self.graph"""
+    config = tf.ConfigProto()
+    if not hub.allow_growth:
+      value = hub.gpu_memory_fraction
+      config.gpu_options.per_process_gpu_memory_fraction = value
+    if hub.intra_op_threads > 0:
+      config.intra_op_parallelism_threads = hub.intra_op_threads
+    return tf.Session(graph=self._graph, config=config)
+
+  def recreate_session(self):
+    """Replace current session by a new one created with current hub
+       configurations, keeping values of all variables"""
+    with self._graph.as_default(), tf.name_scope('Recreate'):
+      mirror = VariableMirror(self._graph, tf.global_variables())
+    values = mirror.snapshot(self.session)
+    self.session.close()
+    self._session = mirror.create_session(self.create_session)
+    mirror.load(self._session, values)
+
   def shutdown(self):
+    if self._ckpt_writer is not None: self._ckpt_writer.close()
     if hub.summary or hub.hp_tuning:
       self._summary_writer.close()
     self.session.close()
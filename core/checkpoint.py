@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+import tensorflow as tf
+
+from tframe.core.mirror import VariableMirror
+from tframe.utils.local import save_checkpoint
+
+
+class CheckpointWriter(object):
+  """CheckpointWriter writes checkpoints on a background thread. Variables
+     are captured as an in-memory snapshot when save is called, then loaded
+     into a writer session of the same graph and saved from there. Pending
+     snapshots coalesce, i.e., only the latest one will be written."""
+
+  def __init__(self, graph, saver, variables, create_session):
+    assert isinstance(graph, tf.Graph) and isinstance(saver, tf.train.Saver)
+    assert callable(create_session)
+    self._saver = saver
+    # Snapshots are loaded into writer session by mirror
+    self._mirror = VariableMirror(graph, variables)
+    self._session = self._mirror.create_session(create_session)
+
+    # (path, values, step) to be written
+    self._pending = None
+    self._writing = False
+    self._closed = False
+    self._error = None
+    self._cond = threading.Condition()
+    self._thread = threading.Thread(target=self._loop, daemon=True)
+    self._thread.start()
+
+  # region : Public Methods
+
+  def save(self, path, session, step):
+    """Take a snapshot of variables in session and schedule it to be written.
+       A snapshot scheduled earlier but not yet written will be dropped"""
+    self._check_error()
+    values = self._mirror.snapshot(session)
+    with self._cond:
+      assert not self._closed
+      self._pending = (path, values, step)
+      self._cond.notify_all()
+
+  def flush(self):
+    """Block until all scheduled snapshots have been written"""
+    with self._cond:
+      while self._pending is not None or self._writing: self._cond.wait()
+    self._check_error()
+
+  def close(self):
+    self.flush()
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+    self._thread.join()
+    self._session.close()
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _loop(self):
+    while True:
+      with self._cond:
+        while self._pending is None and not self._closed: self._cond.wait()
+        if self._pending is None: return
+        (path, values, step), self._pending = self._pending, None
+        self._writing = True
+      try:
+        self._mirror.load(self._session, values)
+        save_checkpoint(path, self._session, self._saver, step)
+      except Exception as e: self._error = e
+      finally:
+        with self._cond:
+          self._writing = False
+          self._cond.notify_all()
+
+  def _check_error(self):
+    if self._error is None: return
+    error, self._error = self._error, None
+    raise error
+
+  # endregion : Private Methods
@@ -2,7 +2,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import collections
+import threading
 
 import tframe as tfr
 from tframe import hub
@@ -18,6 +18,12 @@ class Group(object):
     self._model = model
     # Attributes
     self._slots = []
+    # Fetch plans are compiled lazily and kept until any slot has been
+    # .. changed
+    self._plans = {}
+    # Groups may be run by several threads, e.g., during shadow validation
+    self._lock = threading.Lock()
+    self._revision = Slot.revision
     self._init_slots(slots)
     self.name = name
     # Make sure group has at least one slot
@@ -28,35 +34,24 @@ class Group(object):
 
   # region : Public Methods
 
-  def run(self, feed_dict=None, allow_sum=True):
+  def run(self, feed_dict=None, allow_sum=True, session=None):
     """Run group in session. Slots except SummarySlot should be activated"""
-    fetches = []
-    for slot in self._slots:
-      if isinstance(slot, SummarySlot) and (
-          not slot.activated or not hub.summary or not allow_sum): continue
-      # if not slot.activated:
-      #   raise AssertionError('!! {} must be activated'.format(slot.name))
-      if slot.activated and not slot.sleep: fetches.append(slot)
+    with_sum = hub.summary and allow_sum
+    fetches, num_summaries, tensor_slots = self._get_plan(with_sum)
+    if session is None: session = self._model.session
+    results = session.run(fetches, feed_dict=feed_dict)
 
-    with self._model.graph.as_default():
-      results = self._model.session.run(
-        [slot.op for slot in fetches], feed_dict=feed_dict)
-
-    # Check results
-    tensor_dict = collections.OrderedDict()
-    for slot, val in zip(fetches, results):
-      if isinstance(slot, SummarySlot):
-        self._model.agent.write_summary(val)
-      elif isinstance(slot, (TensorSlot, NestedTensorSlot)):
-        tensor_dict[slot] = val
+    # Write summaries
+    for summ in results[:num_summaries]: self._model.agent.write_summary(summ)
 
     # Return tensor dictionary
-    return tensor_dict
+    return dict(zip(tensor_slots, results[num_summaries:]))
 
   def add(self, slot):
     if not isinstance(slot, Slot):
       raise TypeError('!! member added to a group must be a Slot')
     self._slots.append(slot)
+    self._plans.clear()
 
   # endregion : Public Methods
 
@@ -66,6 +61,35 @@ class Group(object):
     if len(slots) == 0: raise ValueError('!! not slot found')
     for slot in slots: self.add(slot)
 
+  def _get_plan(self, with_sum):
+    """Get compiled plan which is kept until any slot has been changed"""
+    with self._lock:
+      if self._revision != Slot.revision:
+        self._plans.clear()
+        self._revision = Slot.revision
+      plan = self._plans.get(with_sum, None)
+      if plan is None:
+        plan = self._compile_plan(with_sum)
+        self._plans[with_sum] = plan
+    return plan
+
+  def _compile_plan(self, with_sum):
+    """Return (fetches, num_summaries, tensor_slots) in which fetches are
+       ordered as summaries, tensors and operations"""
+    summaries, tensor_slots, others = [], [], []
+    for slot in self._slots:
+      if isinstance(slot, SummarySlot) and not with_sum: continue
+      # if not slot.activated:
+      #   raise AssertionError('!! {} must be activated'.format(slot.name))
+      if not slot.activated or slot.sleep: continue
+      if isinstance(slot, SummarySlot): summaries.append(slot)
+      elif isinstance(slot, (TensorSlot, NestedTensorSlot)):
+        tensor_slots.append(slot)
+      else: others.append(slot)
+
+    fetches = [slot.op for slot in summaries + tensor_slots + others]
+    return fetches, len(summaries), tensor_slots
+
   # endregion : Private Methods
 
 
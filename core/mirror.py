@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+
+class VariableMirror(object):
+  """VariableMirror copies values of variables between sessions of the same
+     graph (or other processes) by taking snapshots as numpy arrays and
+     loading them back through placeholders."""
+
+  def __init__(self, graph, variables):
+    assert isinstance(graph, tf.Graph)
+    self._graph = graph
+    with graph.as_default():
+      self.variables = [var for var in variables if isinstance(var, tf.Variable)]
+      self._placeholders = [tf.placeholder(var.dtype.base_dtype)
+                            for var in self.variables]
+      self._assign_op = tf.group(*[
+        tf.assign(var, p, validate_shape=False)
+        for var, p in zip(self.variables, self._placeholders)])
+
+  # region : Public Methods
+
+  def snapshot(self, session):
+    """Return values of variables in session as a list of numpy arrays"""
+    return session.run(self.variables)
+
+  def load(self, session, values):
+    """Load values taken by snapshot into session"""
+    session.run(self._assign_op, feed_dict=dict(
+      zip(self._placeholders, values)))
+
+  def create_session(self, create_session):
+    """Create a session with create_session() in which all variables have
+       been initialized"""
+    assert callable(create_session)
+    with self._graph.as_default():
+      init_op = tf.global_variables_initializer()
+      session = create_session()
+    session.run(init_op)
+    return session
+
+  # endregion : Public Methods
@@ -10,13 +10,16 @@ class Slot(object):
   """Slots exist in tframe models. Once plugged in with tensorflow op
     during model building stage, they are called 'activated'."""
   op_classes = []
+  # Increased each time a slot is plugged, substituted or sent to sleep so
+  # .. that fetch plans compiled by groups can be invalidated
+  revision = 0
 
   def __init__(self, model, name):
     assert isinstance(model, tfr.models.Model)
     self._model = model
     self._op = None
+    self._sleep = False
     self.name = name
-    self.sleep = False
 
   # region : Properties
 
@@ -28,6 +31,15 @@ class Slot(object):
   def op(self):
     return self._op
 
+  @property
+  def sleep(self):
+    return self._sleep
+
+  @sleep.setter
+  def sleep(self, val):
+    if val != self._sleep: self._touch()
+    self._sleep = val
+
   # endregion : Properties
 
   # region : Overriding
@@ -43,14 +55,17 @@ class Slot(object):
     if op.__class__ not in self.op_classes:
       raise TypeError('!! op should be in {}'.format(self.op_classes))
     self._op = op
+    self._touch()
 
   def substitute(self, op):
     if op.__class__ not in self.op_classes:
       raise TypeError('!! op should be in {}'.format(self.op_classes))
     self._op = op
+    self._touch()
 
-  def run(self, feed_dict=None):
-    return self._model.session.run(self._op, feed_dict=feed_dict)
+  def run(self, feed_dict=None, session=None):
+    if session is None: session = self._model.session
+    return session.run(self._op, feed_dict=feed_dict)
 
   # TODO: when everything is settled, remove this method
   def run_(self, fetches=None, feed_dict=None):
@@ -83,6 +98,13 @@ class Slot(object):
 
   # endregion : Public Methods
 
+  # region : Private Methods
+
+  def _touch(self):
+    Slot.revision += 1
+
+  # endregion : Private Methods
+
 
 class TensorSlot(Slot):
   op_classes = [tf.Tensor]
@@ -128,6 +150,7 @@ class NestedTensorSlot(Slot):
   def plug(self, op, **kwargs):
     self._check_op(op)
     self._op = op
+    self._touch()
 
   @staticmethod
   def _check_op(entity):
@@ -155,15 +178,20 @@ class IndependentSummarySlot(SummarySlot):
     self._op = None
 
   def write(self, val):
-    # Check tensor
-    if self._mascot is None:
-      self._mascot = tf.placeholder(dtype=tf.float32)
-      self._op = tf.summary.scalar(
-        self.name, self._mascot, collections=[tfr.pedia.invisible])
+    self.build()
     assert self.activated
     summ = self._model.session.run(self.summary, feed_dict={self._mascot: val})
     self._model.agent.write_summary(summ)
 
+  def build(self):
+    """Create placeholder and summary op if they have not been created.
+       Should be called in advance if summaries are written from other
+       threads, since graph building is not thread-safe"""
+    if self._mascot is not None: return
+    self._mascot = tf.placeholder(dtype=tf.float32)
+    self._op = tf.summary.scalar(
+      self.name, self._mascot, collections=[tfr.pedia.invisible])
+
 
 class OperationSlot(Slot):
   op_classes = [tf.Operation, tf.Tensor]
@@ -124,6 +124,12 @@ class TFRData(object):
     if extension != cls.EXTENSION:
       raise TypeError('!! {} can not load .{} file'.format(
         cls.__name__, extension))
+    return cls._load(filename)
+
+  @classmethod
+  def _load(cls, filename):
+    """Load data from a local file, can be overridden by subclasses which
+       support other formats"""
     with open(filename, 'rb') as input_:
       return pickle.load(input_)
 
@@ -3,11 +3,17 @@ from __future__ import division
 from __future__ import print_function
 
 import os
+import copy
+import hashlib
 import numpy as np
 import collections
+import multiprocessing
+
+from concurrent import futures
 
 from tframe import console
 from tframe import checker
+from tframe import hub
 from tframe.utils.local import check_path
 from tframe.data.base_classes import TFRData
 from tframe.data.dataset import DataSet
@@ -20,12 +26,24 @@ class BigData(TFRData):
   FILE_NAME = 'bigdata.meta'
   EXTENSION = 'meta'
 
+  STREAMING = 'STREAMING'
+  NUM_SHARDS = 'NUM_SHARDS'
+
+  # Fingerprints of files, initialized lazily for metadata saved before
+  # .. fingerprints were introduced
+  fingerprints = None
+
   def __init__(self, data_dir, **kwargs):
     """self.files = {filename1: data_size_1,
                      filename2: data_size_2
                      ... ...}
+       self.fingerprints = {filename1: (size, mtime, hash), ...}
+
+       Files will be scanned on a process pool with `num_workers` (provided
+       in kwargs) processes. By default the pool size is hub.scan_workers.
     """
     self.files = {}
+    self.fingerprints = {}
     self.properties = collections.OrderedDict()
     self.data_dir = data_dir
     self.name = os.path.basename(data_dir)
@@ -33,12 +51,21 @@ class BigData(TFRData):
     self.round_len_f = None
 
     # Generate data info
-    self._generate_meta(data_dir)
+    self._generate_meta(data_dir, kwargs.get('num_workers', None))
 
     if kwargs.get('save', True): self.save()
 
   # region : Properties
 
+  @property
+  def streaming(self):
+    return self.properties.get(self.STREAMING, False)
+
+  @property
+  def num_shards(self):
+    if not self.streaming: return 1
+    return self.properties.get(self.NUM_SHARDS, 1)
+
   @property
   def structure(self):
     return list(self.files.values())
@@ -76,23 +103,50 @@ class BigData(TFRData):
     return round_len
 
   def gen_batches(self, batch_size, shuffle=False):
-    for f in self.files.keys():
-      file_path = os.path.join(self.data_dir, f)
-      data_set = self._load_data_set(file_path)
-      self._check_data_set(data_set)
+    data_sets = self._gen_data_sets(shuffle)
+    if shuffle and self.num_shards > 1:
+      for batch in self._interleave(data_sets, batch_size): yield batch
+      return
+    for data_set in data_sets:
       for batch in data_set.gen_batches(batch_size, shuffle):
         yield batch
       del data_set
 
   def gen_rnn_batches(self, batch_size=1, num_steps=-1, shuffle=False):
-    for f in self.files.keys():
-      file_path = os.path.join(self.data_dir, f)
-      data_set = self._load_data_set(file_path)
-      self._check_data_set(data_set)
+    # Batches from different files are not interleaved here since RNN states
+    # .. are carried between consecutive batches
+    for data_set in self._gen_data_sets(shuffle):
       for batch in data_set.gen_rnn_batches(batch_size, num_steps, shuffle):
         yield batch
       del data_set
 
+  def turn_streaming_on(self, num_shards=1):
+    """In streaming mode,
+       (1) the next file is loaded on a background thread while the current
+           one is being consumed
+       (2) file order is shuffled each round if shuffle is True
+       (3) if num_shards > 1, batches generated by gen_batches with shuffle on
+           will be randomly drawn from `num_shards` files opened at the same
+           time
+    """
+    checker.check_positive_integer(num_shards, 'num_shards')
+    self.properties[self.STREAMING] = True
+    self.properties[self.NUM_SHARDS] = num_shards
+
+  def shard(self, index, num):
+    """Get the index-th of `num` disjoint shards of this data. Files are
+       assigned to shards in a round-robin way"""
+    checker.check_positive_integer(num, 'num')
+    assert 0 <= index < num
+    if self.size < num: raise ValueError(
+      '!! {} files in {} can not be split into {} shards'.format(
+        self.size, self.name, num))
+    file_names = list(self.files.keys())[index::num]
+    data = copy.copy(self)
+    data.files = {name: self.files[name] for name in file_names}
+    data.properties = self.properties.copy()
+    return data
+
   def load_data_set(self, index=0):
     file_name = list(self.files.keys())[index]
     return self._load_data_set(os.path.join(self.data_dir, file_name))
@@ -114,10 +168,13 @@ class BigData(TFRData):
       bd = super().load(bd_path)
       bd.data_dir = data_dir
       assert isinstance(bd, BigData)
-      bd._check_data_files(data_dir)
     except:
       console.show_status('Metadata not found.')
       bd = cls(data_dir, **kwargs)
+    else:
+      # Only new or changed files will be scanned
+      if (bd._update_meta(data_dir, kwargs.get('num_workers', None))
+          and kwargs.get('save', True)): bd.save()
 
     # Return bigdata
     console.show_status('{} files loaded from {}'.format(bd.size, data_dir))
@@ -134,6 +191,53 @@ class BigData(TFRData):
     if isinstance(data_set, SignalSet) and data_set.features is None:
       data_set.init_features_and_targets()
 
+  def _load_and_check(self, file_name):
+    data_set = self._load_data_set(os.path.join(self.data_dir, file_name))
+    self._check_data_set(data_set)
+    return data_set
+
+  def _gen_data_sets(self, shuffle):
+    """Generate data sets file by file"""
+    file_names = list(self.files.keys())
+    if not self.streaming:
+      for f in file_names: yield self._load_and_check(f)
+      return
+
+    # Streaming mode
+    if shuffle: np.random.shuffle(file_names)
+    executor = futures.ThreadPoolExecutor(max_workers=1)
+    try:
+      future = None
+      if len(file_names) > 0:
+        future = executor.submit(self._load_and_check, file_names[0])
+      for i in range(len(file_names)):
+        data_set = future.result()
+        # Load next file in background
+        if i + 1 < len(file_names):
+          future = executor.submit(self._load_and_check, file_names[i + 1])
+        yield data_set
+        del data_set
+    finally: executor.shutdown(wait=False)
+
+  def _interleave(self, data_sets, batch_size):
+    """Draw shuffled batches randomly from `num_shards` opened data sets"""
+    data_sets, streams = iter(data_sets), []
+    def open_next_shard():
+      data_set = next(data_sets, None)
+      if data_set is None: return
+      streams.append(data_set.gen_batches(batch_size, shuffle=True))
+
+    for _ in range(self.num_shards): open_next_shard()
+    while len(streams) > 0:
+      index = np.random.randint(len(streams))
+      batch = next(streams[index], None)
+      if batch is None:
+        # Replace the exhausted shard with a new one
+        streams.pop(index)
+        open_next_shard()
+        continue
+      yield batch
+
   @staticmethod
   def _load_data_set(file_name):
     assert isinstance(file_name, str)
@@ -149,36 +253,113 @@ class BigData(TFRData):
     check_path(data_dir, create_path=False)
     file_list = []
     for f in os.listdir(data_dir):
-      file_path = os.path.join(data_dir, f)
-      if not os.path.isfile(file_path): continue
+      # Data sets saved in columnar format are directories
       if not 'tfd' in f.split('.')[-1]: continue
       file_list.append(os.path.join(data_dir, f))
 
     return file_list
 
-  def _check_data_files(self, data_dir):
-    file_list = self._get_tfd_list(data_dir)
+  def _update_meta(self, data_dir, num_workers=None):
+    """Update metadata according to files in data_dir. Files whose size and
+       modification time match their fingerprints will not be opened.
+       Return True if metadata has been modified"""
     console.show_status('Integrity checking ...')
-    for i, f in enumerate(file_list):
-      if os.path.basename(f) not in self.files.keys():
-        raise AssertionError('!! Can not find {} in metadata'.format(f))
-      console.print_progress(i, len(file_list))
-    if len(self.files) != len(file_list):
-      raise AssertionError(
-        '!! {} files are expected but only {} are found'.format(
-          len(self.files), len(file_list)))
-
-  def _generate_meta(self, data_dir):
-    console.show_status('Scanning data directory ...')
+    if self.fingerprints is None: self.fingerprints = {}
     file_list = self._get_tfd_list(data_dir)
+    names = [os.path.basename(f) for f in file_list]
+    modified = False
+
+    # Remove metadata of files which no longer exist
+    for name in set(self.files.keys()) - set(names):
+      self.files.pop(name)
+      self.fingerprints.pop(name, None)
+      modified = True
+
+    # Find files to scan along with fingerprints already computed
+    to_scan, fps = [], []
+    for file_path, name in zip(file_list, names):
+      fp, new_fp = self.fingerprints.get(name, None), None
+      if name in self.files and fp is not None:
+        if self._stat(file_path) == fp[:2]: continue
+        # Files touched without content change need not be rescanned
+        new_fp = self._fingerprint(file_path)
+        if new_fp[0] == fp[0] and new_fp[2] == fp[2]:
+          self.fingerprints[name] = new_fp
+          modified = True
+          continue
+      to_scan.append(file_path)
+      fps.append(new_fp)
+
+    if len(to_scan) > 0:
+      console.show_status('Scanning {} new or changed files ...'.format(
+        len(to_scan)))
+      self._scan(to_scan, num_workers, fps)
+      modified = True
+    return modified
+
+  def _generate_meta(self, data_dir, num_workers=None):
+    console.show_status('Scanning data directory ...')
+    self._scan(self._get_tfd_list(data_dir), num_workers)
 
-    # Scan directory
+  def _scan(self, file_list, num_workers=None, fingerprints=None):
+    """Read structures and fingerprints of files in file_list. Fingerprints
+       provided (None for those not computed yet) will not be computed again"""
     num_files = len(file_list)
-    for i, file_name in enumerate(file_list):
-      data_set = self._load_data_set(file_name)
-      self.files[os.path.basename(file_name)] = data_set.structure
-      console.print_progress(i + 1, num_files)
-      del data_set
+    if fingerprints is None: fingerprints = [None] * num_files
+    if num_workers is None: num_workers = hub.scan_workers
+    if num_workers == 1 or num_files < 2:
+      results = map(self._scan_file, file_list, fingerprints)
+      executor = None
+    else:
+      # Processes are spawned since forking after tensorflow has been
+      # .. imported is unsafe
+      executor = futures.ProcessPoolExecutor(
+        max_workers=num_workers if num_workers > 0 else None,
+        mp_context=multiprocessing.get_context('spawn'))
+      results = executor.map(self._scan_file, file_list, fingerprints)
+
+    try:
+      for i, (file_path, (structure, fp)) in enumerate(
+          zip(file_list, results)):
+        name = os.path.basename(file_path)
+        self.files[name] = structure
+        self.fingerprints[name] = fp
+        console.print_progress(i + 1, num_files)
+    finally:
+      if executor is not None: executor.shutdown()
+
+  @staticmethod
+  def _scan_file(file_path, fp=None):
+    """Return (structure, fingerprint) of a data file. This method may be
+       called in a child process"""
+    if fp is None: fp = BigData._fingerprint(file_path)
+    data_set = BigData._load_data_set(file_path)
+    return data_set.structure, fp
+
+  @staticmethod
+  def _stat(path):
+    """Return (size, mtime) of a file or a data set directory"""
+    if not os.path.isdir(path):
+      stat = os.stat(path)
+      return stat.st_size, stat.st_mtime
+    size, mtime = 0, 0
+    for f in os.listdir(path):
+      stat = os.stat(os.path.join(path, f))
+      size, mtime = size + stat.st_size, max(mtime, stat.st_mtime)
+    return size, mtime
+
+  @staticmethod
+  def _fingerprint(path, chunk_size=1 << 20):
+    """Return (size, mtime, hash) of a file or a data set directory. The
+       whole content is hashed so that any edit will be detected"""
+    md5 = hashlib.md5()
+    paths = [path] if not os.path.isdir(path) else [
+      os.path.join(path, f) for f in sorted(os.listdir(path))]
+    for p in paths:
+      md5.update(str(os.path.getsize(p)).encode())
+      with open(p, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''): md5.update(chunk)
+    return BigData._stat(path) + (md5.hexdigest(),)
 
   # endregion : Private Methods
 
@@ -2,6 +2,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+import copy
 import numpy as np
 import pickle
 
@@ -17,6 +19,15 @@ class DataSet(TFRData):
   """"""
   EXTENSION = 'tfd'
 
+  # Parallel engine round lengths keyed by configurations, initialized lazily
+  _round_len_cache = None
+
+  # Keys used in columnar format
+  HEADER = 'header.pkl'
+  DATA_DICT = 'data_dict'
+  ARRAY = 'array'
+  ARRAY_LIST = 'array_list'
+
   def __init__(self, features=None, targets=None, data_dict=None,
                name='dataset1', in_rnn_format=False, **kwargs):
     """
@@ -163,6 +174,8 @@ class DataSet(TFRData):
       # :: For recurrent models
       checker.check_type(num_steps, int)
       if self.is_regular_array: arrays = [self.features]
+      elif hub.bucket_batches:
+        return self._get_bucket_round_length(batch_size, num_steps)
       elif self.parallel_on:
         return self._get_pe_round_length(batch_size, num_steps)
       else: arrays = self.features
@@ -180,15 +193,25 @@ class DataSet(TFRData):
     (2) When data is list of sequences:
         Data will be stacked first and extracted as it does in (1)
 
+    When shuffle is True, data will be permuted once at the beginning of
+    each round and batches will be sliced out of the permuted copy in order.
+    Batches are views of the underlying arrays thus no data will be copied.
+
     :param batch_size: Batch size
     :param shuffle: Whether to shuffle
     :return: A generator producing batches of data
     """
     round_len = self.get_round_length(batch_size)
+    data_set = self.stack
+    if shuffle and hub.rand_over_classes:
+      # Sampling over classes can not be done via permutation
+      for _ in range(round_len):
+        yield data_set[self._rand_indices(size=batch_size)]
+      return
+    if shuffle:
+      data_set = data_set._permute(np.random.permutation(data_set.size))
     for i in range(round_len):
-      yield self.stack[
-        self._rand_indices(size=batch_size) if shuffle
-        else range(i * batch_size, min((i + 1) * batch_size, self.stack.size))]
+      yield data_set._slice(i * batch_size, (i + 1) * batch_size)
 
   def gen_rnn_batches(self, batch_size=1, num_steps=-1, shuffle=False):
     """ Generate data batches with steps
@@ -197,7 +220,8 @@ class DataSet(TFRData):
         chopped in order into batches and then chopped in order into step blocks
         with the specified size
     (2) When data is a list of sequences:
-        rnn batches will be generated sequence by sequence
+        rnn batches will be generated sequence by sequence, or bucket by bucket
+        if hub.bucket_batches is on
 
     The default parameters are for batch validation
 
@@ -210,6 +234,10 @@ class DataSet(TFRData):
     round_len = self.get_round_length(batch_size, num_steps)
     # Put features and targets into lists
     if self.is_regular_array: features = [self.features]
+    elif hub.bucket_batches:
+      for batch in self._gen_bucketed_batches(batch_size, num_steps, shuffle):
+        yield batch
+      return
     elif self.parallel_on:
       for batch in self._gen_parallel_batches(batch_size, num_steps, shuffle):
         assert isinstance(batch, DataSet)
@@ -278,8 +306,118 @@ class DataSet(TFRData):
 
     return data_sets
 
+  def shard(self, index, num):
+    """Get the index-th of `num` disjoint shards of this data set. Samples
+       are assigned to shards in a round-robin way"""
+    checker.check_positive_integer(num, 'num')
+    assert 0 <= index < num
+    if self.size < num: raise ValueError(
+      '!! {} samples in {} can not be split into {} shards'.format(
+        self.size, self.name, num))
+    indices = np.arange(index, self.size, num)
+    take = lambda val: (val[indices] if isinstance(val, np.ndarray)
+                        else [val[i] for i in indices])
+    targets = None if self.targets is None else take(self.targets)
+    data_dict = {key: take(val) for key, val in self.data_dict.items()
+                 if len(val) == self.size}
+    return self._spawn(take(self.features), targets, data_dict)
+
   # endregion : Public Methods
 
+  # region : Load and Save
+
+  def save(self, filename, columnar=False):
+    """Save data set to disk.
+    (1) By default, the whole data set is pickled into a single file
+    (2) If columnar is True, a directory will be created, holding each data
+        array in a .npy file along with a small pickled header. Data sets saved
+        in this way will be loaded as memory maps, so that only pages touched
+        will be read and the page cache can be shared among processes
+    """
+    if not columnar: return super().save(filename)
+    if filename.split('.')[-1] != self.EXTENSION:
+      filename += '.{}'.format(self.EXTENSION)
+    if not os.path.exists(filename): os.makedirs(filename)
+    # Remove files written before so that no stale array will be loaded
+    for f in os.listdir(filename):
+      if f == self.HEADER or f.endswith('.npy'):
+        os.remove(os.path.join(filename, f))
+
+    # Arrays will be removed from a shallow copy of this data set
+    shell = copy.copy(self)
+    shell._stacked_data, shell._rnn_data = None, None
+    # Write arrays. Attributes of ndarray subclasses, e.g., fs of Signal, are
+    # .. kept in header
+    state = lambda a: (None if type(a) in (np.ndarray, np.memmap)
+                       else dict(vars(a)))
+    def write(array, name):
+      if isinstance(array, np.ndarray):
+        np.save(os.path.join(filename, name), array)
+        return self.ARRAY, name, type(array), state(array)
+      assert isinstance(array, (list, tuple)) and len(array) > 0
+      offsets = np.cumsum([0] + [len(a) for a in array]).tolist()
+      np.save(os.path.join(filename, name), np.concatenate(array, axis=0))
+      return (self.ARRAY_LIST, name, type(array[0]), offsets, type(array),
+              [state(a) for a in array])
+
+    # Only numpy arrays (or lists of numpy arrays) will be written into .npy
+    # .. files, other objects (including arrays of objects) are kept in header
+    layout = {}
+    for key in (pedia.features, pedia.targets):
+      if not self._is_array_or_array_list(getattr(self, key)): continue
+      layout[key] = write(getattr(self, key), '{}.npy'.format(key))
+      setattr(shell, key, None)
+    shell.data_dict, data_dict_layout = {}, {}
+    for i, (key, val) in enumerate(self.data_dict.items()):
+      if self._is_array_or_array_list(val):
+        data_dict_layout[key] = write(val, 'data_dict_{}.npy'.format(i))
+      else: shell.data_dict[key] = val
+    layout[self.DATA_DICT] = data_dict_layout
+
+    # Write header
+    with open(os.path.join(filename, self.HEADER), 'wb') as output:
+      pickle.dump((shell, layout), output, pickle.HIGHEST_PROTOCOL)
+
+  @classmethod
+  def _load(cls, filename):
+    if not os.path.isdir(filename): return super()._load(filename)
+    # Load data set saved in columnar format
+    with open(os.path.join(filename, cls.HEADER), 'rb') as input_:
+      data_set, layout = pickle.load(input_)
+    assert isinstance(data_set, DataSet)
+
+    def read(spec):
+      # Arrays are mapped in copy-on-write mode so that in-place modification
+      # .. will not be written back to disk
+      array = np.load(os.path.join(filename, spec[1]), mmap_mode='c')
+      def view(a, state):
+        if spec[2] in (np.ndarray, np.memmap): return a
+        a = a.view(spec[2])
+        a.__dict__.update(state)
+        return a
+      if spec[0] == cls.ARRAY: return view(array, spec[3])
+      assert spec[0] == cls.ARRAY_LIST
+      offsets, container, states = spec[3], spec[4], spec[5]
+      return container([view(array[offsets[i]:offsets[i + 1]], states[i])
+                        for i in range(len(offsets) - 1)])
+
+    for key in (pedia.features, pedia.targets):
+      if key in layout: setattr(data_set, key, read(layout[key]))
+    for key, spec in layout[cls.DATA_DICT].items():
+      data_set.data_dict[key] = read(spec)
+    return data_set
+
+  @staticmethod
+  def _is_array_or_array_list(val):
+    # Arrays of objects can not be memory-mapped
+    is_array = lambda a: isinstance(a, np.ndarray) and a.dtype != object
+    if isinstance(val, np.ndarray): return is_array(val)
+    if not isinstance(val, (list, tuple)) or len(val) == 0: return False
+    if not all([is_array(a) for a in val]): return False
+    return len(set([a.shape[1:] for a in val])) == 1 and val[0].ndim > 0
+
+  # endregion : Load and Save
+
   # region : Private Methods
 
   def _finalize(self, data_set):
@@ -335,6 +473,44 @@ class DataSet(TFRData):
               raise ValueError(
                 '!! samples in {} list should have the same shape'.format(key))
 
+  def _spawn(self, features, targets, data_dict=None, in_rnn_format=None,
+             plain=False):
+    """Create a data set sharing properties with this data set. Sanity check
+       is skipped since data provided is supposed to be taken from this
+       checked data set. If plain is True, a plain DataSet without properties
+       will be created, e.g., for RNN batches."""
+    data_set = DataSet.__new__(DataSet)
+    data_set.features, data_set.targets = features, targets
+    data_set.data_dict = {} if data_dict is None else data_dict
+    data_set.properties = {} if plain else self.properties.copy()
+    data_set.name = self.name
+    data_set._stacked_data, data_set._rnn_data = None, None
+    data_set.in_rnn_format = (
+      self.in_rnn_format if in_rnn_format is None else in_rnn_format)
+    data_set.should_reset_state = False
+    data_set.reset_batch_indices, data_set.reset_values = None, None
+    return data_set if plain else self._finalize(data_set)
+
+  def _slice(self, start, stop):
+    """Get data in [start, stop) as a data set. Arrays in the returned data
+       set are views of those in this data set"""
+    assert self.is_regular_array
+    item = slice(start, min(stop, self.size))
+    targets = None if self.targets is None else self.targets[item]
+    data_dict = {key: val[item] for key, val in self.data_dict.items()
+                 if len(val) == self.size}
+    return self._spawn(self.features[item], targets, data_dict)
+
+  def _permute(self, indices):
+    """Get a permuted copy of this data set"""
+    assert self.is_regular_array and len(indices) == self.size
+    take = lambda val: (val[indices] if isinstance(val, np.ndarray)
+                        else [val[i] for i in indices])
+    targets = None if self.targets is None else self.targets[indices]
+    data_dict = {key: take(val) for key, val in self.data_dict.items()
+                 if len(val) == self.size}
+    return self._spawn(self.features[indices], targets, data_dict)
+
   def _check_feature(self):
     if self.features is None: raise AssertionError(
       '!! no features found in {}'.format(self.name))
@@ -351,7 +527,7 @@ class DataSet(TFRData):
       else:
         assert len(y) == 1
         data_y = y
-    # Chop data further
+    # Chop data further. Step blocks are views of batch partitions
     if num_steps < 0: num_steps = L
     round_len = int(np.ceil(L / num_steps))
     for i in range(round_len):
@@ -362,21 +538,92 @@ class DataSet(TFRData):
           batch_y = data_y[:, i * num_steps:min((i + 1) * num_steps, L)]
         else:
           assert isinstance(y, np.ndarray)
-          batch_y = np.tile(y, [batch_x.shape[0], batch_x.shape[1], 1])
-      batch = DataSet(batch_x, batch_y, in_rnn_format=True)
+          # Sequence label is broadcast to each step without copying
+          batch_y = np.broadcast_to(y, batch_x.shape[:2] + y.shape[1:])
+      batch = self._spawn(batch_x, batch_y, in_rnn_format=True, plain=True)
       # State should be reset at the beginning of a sequence
       if i == 0: batch.should_reset_state = True
       batch.name = self.name + '_{}'.format(i + 1)
       yield batch
 
+  def _gen_bucketed_batches(self, batch_size, num_steps, shuffle):
+    """Sequences of similar lengths are batched together. Each batch is padded
+       to the length of its longest sequence and carries a mask in data_dict
+       indicating valid steps"""
+    checker.check_positive_integer(batch_size, 'batch size')
+    checker.check_type(num_steps, int)
+    for bucket in self._get_buckets(batch_size, shuffle):
+      xs, ys = [], []
+      for index in bucket:
+        x = self.features[index]
+        y = None if self.targets is None else self.targets[index]
+        if self.init_f is not None: x, y = self.init_f(x, y)
+        # Sequence label is broadcast to each step
+        if y is not None and len(y) != len(x):
+          assert len(y) == 1
+          y = np.broadcast_to(y, (len(x),) + y.shape[1:])
+        xs.append(x)
+        ys.append(y)
+      lengths = np.array([len(x) for x in xs])
+      L = int(max(lengths))
+      mask = np.arange(L) < lengths[:, None]
+      data_x = self._pad(xs, L)
+      data_y = None if self.targets is None else self._pad(ys, L)
+      # Chop data further
+      steps = L if num_steps < 0 else num_steps
+      for i in range(int(np.ceil(L / steps))):
+        block = slice(i * steps, min((i + 1) * steps, L))
+        batch = self._spawn(
+          data_x[:, block], None if data_y is None else data_y[:, block],
+          {pedia.mask: mask[:, block]}, in_rnn_format=True, plain=True)
+        # State should be reset at the beginning of a bucket
+        if i == 0: batch.should_reset_state = True
+        batch.name = self.name + '_{}'.format(i + 1)
+        yield batch
+
+  def _get_buckets(self, batch_size, shuffle):
+    """Sort sequences by length and group every `batch_size` consecutive
+       ones into a bucket. When shuffle is on, sequences of the same length
+       are sorted randomly and buckets are yielded in random order"""
+    lengths = self._get_lengths()
+    tie_breaker = (np.random.rand(len(lengths)) if shuffle
+                   else np.arange(len(lengths)))
+    order = np.lexsort((tie_breaker, lengths))
+    buckets = [order[i:i + batch_size]
+               for i in range(0, len(order), batch_size)]
+    if shuffle: np.random.shuffle(buckets)
+    return buckets
+
+  def _get_bucket_round_length(self, batch_size, num_steps):
+    if self.init_f is not None and self.len_f is None: return None
+    if num_steps < 0: return int(np.ceil(self.size / batch_size))
+    lengths = np.sort(self._get_lengths())
+    return int(sum([np.ceil(lengths[min(i + batch_size, len(lengths)) - 1]
+                            / num_steps)
+                    for i in range(0, len(lengths), batch_size)]))
+
+  def _get_lengths(self):
+    """Get lengths of sequences after being initialized by init_f"""
+    lengths = np.array(self.structure)
+    if self.len_f is None: return lengths
+    return np.array([self.len_f(l) for l in lengths])
+
+  @staticmethod
+  def _pad(arrays, length):
+    """Stack arrays of different lengths into a zero-padded array"""
+    result = np.zeros((len(arrays), length) + arrays[0].shape[1:],
+                      dtype=arrays[0].dtype)
+    for i, array in enumerate(arrays): result[i, :len(array)] = array
+    return result
+
   def _get_batch_partition(self, array, batch_size):
+    """Partition array into `batch_size` consecutive parts of the same length.
+       The result is a reshaped view of the truncated array when possible"""
     assert isinstance(array, np.ndarray)
-    sample_shape = array[0].shape
+    sample_shape = array.shape[1:]
     # Get batch partition length
     L = len(array) // batch_size
-    data = np.zeros([batch_size, L, *sample_shape])
-    for i in range(batch_size):
-      data[i] = array[i * L:(i + 1) * L, :]
+    data = np.reshape(array[:batch_size * L], (batch_size, L, *sample_shape))
     # Return result
     return data, L
 
@@ -391,8 +638,9 @@ class DataSet(TFRData):
     assert isinstance(num_steps, int)
     assert isinstance(shuffle, bool)
 
-    # Initialize parallel engine
-    pe = ParallelEngine(batch_size)
+    # Initialize parallel engine. Batches emitted share ring buffers, which
+    # .. should outnumber batches alive in the prefetching queue
+    pe = ParallelEngine(batch_size, buffer_num=hub.prefetch_depth + 2)
     cursor, num_sequences = 0, len(self.features)
     round_len = self._get_pe_round_length(batch_size, num_steps)
 
@@ -443,8 +691,14 @@ class DataSet(TFRData):
   def _get_pe_round_length(self, batch_size, num_steps):
     if self.init_f is not None and self.len_f is None: return None
     if self.init_f is None: assert self.len_f is None
-    return ParallelEngine.get_round_length(
-      batch_size, num_steps, self.structure, len_f=self.len_f)
+    # Round length is calculated only once for each configuration
+    structure = self.structure
+    key = (batch_size, num_steps, self.len_f, tuple(structure))
+    if self._round_len_cache is None: self._round_len_cache = {}
+    if key not in self._round_len_cache:
+      self._round_len_cache[key] = ParallelEngine.get_round_length(
+        batch_size, num_steps, structure, len_f=self.len_f)
+    return self._round_len_cache[key]
 
   def _rand_indices(self, upper_bound=None, size=1):
     if upper_bound is None: upper_bound = self.size
@@ -1,27 +1,48 @@
+import heapq
 import numpy as np
 
 from tframe import checker
 
 
 class ParallelEngine(object):
-  def __init__(self, batch_size):
-    self._sequences = [None] * checker.check_positive_integer(batch_size)
-    self._targets = [None] * self.size
-    self._cursors = [0] * self.size
+  """Parallel engine holds `batch_size` sequences in lanes and emits step
+     blocks of all lanes at once.
+
+     Sequences (and targets) loaded into the engine are copied into
+     preallocated lane arrays of shape [batch_size, capacity, *sample_shape]
+     so that each emission can be done by a single gather operation. Emitted
+     arrays are written into a ring of `buffer_num` output buffers, i.e., the
+     arrays returned by emit will be overwritten after `buffer_num` calls.
+  """
+  def __init__(self, batch_size, buffer_num=1):
+    self._batch_size = checker.check_positive_integer(batch_size)
+    self._buffer_num = checker.check_positive_integer(buffer_num)
+    # self._slots[i] is the lane index of the i-th position in engine.
+    # Lengths and cursors are indexed by lanes
+    self._slots = np.arange(batch_size)
+    self._lengths = np.zeros(batch_size, dtype=np.int64)
+    self._cursors = np.zeros(batch_size, dtype=np.int64)
+    # Lane arrays will be initialized when the first sequence is loaded
+    self._capacity = 0
+    self._x_lanes = None
+    self._y_lanes = None
+    # Ring buffers for emission
+    self._buffers = {}
+    self._buffer_cursor = 0
 
   # region : Properties
 
   @property
   def size(self):
-    return len(self._sequences)
+    return len(self._slots)
 
   @property
   def remainders(self):
-    return [len(s) - c for s, c in zip(self._sequences, self._cursors)]
+    return self._lengths[self._slots] - self._cursors[self._slots]
 
   @property
   def max_emit_length(self):
-    return min(self.remainders)
+    return int(np.min(self.remainders))
 
   @property
   def is_ready(self):
@@ -29,16 +50,13 @@ class ParallelEngine(object):
 
   @property
   def inactive_indices(self):
-    indices = np.argwhere(
-      [s is None or len(s) - c == 0
-       for s, c in zip(self._sequences, self._cursors)]).ravel()
-    return list(indices)
+    return np.flatnonzero(self.remainders == 0).tolist()
 
   @property
   def next_inactive_index(self):
-    indices = self.inactive_indices
+    indices = np.flatnonzero(self.remainders == 0)
     if len(indices) == 0: return None
-    else: return indices[0]
+    else: return int(indices[0])
 
   @property
   def flameout(self):
@@ -50,13 +68,62 @@ class ParallelEngine(object):
 
   def _set_sequence(self, index, sequence, target):
     if sequence is None:
-      self._sequences.pop(index)
-      self._targets.pop(index)
-      self._cursors.pop(index)
-    else:
-      self._sequences[index] = sequence
-      self._targets[index] = target
-      self._cursors[index] = 0
+      self._slots = np.delete(self._slots, index)
+      return
+    assert isinstance(sequence, np.ndarray) and isinstance(target, np.ndarray)
+    length = len(sequence)
+    if len(target) != 1: assert len(target) == length
+    self._check_lanes(sequence, self._x_lanes, 'sequence')
+    self._check_lanes(target, self._y_lanes, 'target')
+    # Copy data into lane
+    self._reserve(length, sequence, target)
+    lane = self._slots[index]
+    self._x_lanes[lane, :length] = sequence
+    # Sequence label will be broadcast along time axis
+    self._y_lanes[lane, :length] = target[0] if len(target) == 1 else target
+    self._lengths[lane] = length
+    self._cursors[lane] = 0
+
+  @staticmethod
+  def _check_lanes(array, lanes, name):
+    """Lane dtype and shape are fixed by the first sequence loaded"""
+    if lanes is None: return
+    if array.dtype != lanes.dtype: raise TypeError(
+      '!! {} dtype {} does not match lane dtype {}'.format(
+        name, array.dtype, lanes.dtype))
+    if array.shape[1:] != lanes.shape[2:]: raise ValueError(
+      '!! {} sample shape {} does not match lane sample shape {}'.format(
+        name, array.shape[1:], lanes.shape[2:]))
+
+  def _reserve(self, length, sequence, target):
+    """Make sure lanes can hold a sequence of the given length"""
+    if self._x_lanes is not None and length <= self._capacity: return
+    capacity = max(length, 2 * self._capacity)
+    init_lanes = lambda array: np.zeros(
+      shape=(self._batch_size, capacity, *array.shape[1:]), dtype=array.dtype)
+    x_lanes, y_lanes = init_lanes(sequence), init_lanes(target)
+    # Copy existing data to new lanes
+    if self._x_lanes is not None:
+      x_lanes[:, :self._capacity] = self._x_lanes
+      y_lanes[:, :self._capacity] = self._y_lanes
+    self._x_lanes, self._y_lanes = x_lanes, y_lanes
+    self._capacity = capacity
+
+  def _get_buffer(self, key, shape, dtype):
+    """Get an output buffer of the given shape from current ring slot"""
+    ring = self._buffers.setdefault(key, [None] * self._buffer_num)
+    size = int(np.prod(shape))
+    buffer = ring[self._buffer_cursor]
+    if buffer is None or buffer.size < size or buffer.dtype != dtype:
+      buffer = np.empty(shape=(size,), dtype=dtype)
+      ring[self._buffer_cursor] = buffer
+    return buffer[:size].reshape(shape)
+
+  def _gather(self, lanes, indices, key):
+    flat_lanes = lanes.reshape(-1, *lanes.shape[2:])
+    output = self._get_buffer(key, indices.shape + lanes.shape[2:], lanes.dtype)
+    np.take(flat_lanes, indices, axis=0, out=output)
+    return output
 
   # endregion : Private Methods
 
@@ -75,55 +142,54 @@ class ParallelEngine(object):
     assert self.is_ready
     assert isinstance(num_steps, int)
     if num_steps < 0: num_steps = self.max_emit_length
-
     steps = min(self.max_emit_length, num_steps)
-    feature_shape = self._sequences[0].shape[1:]
-    target_shape = self._targets[0].shape[1:]
-
-    features = np.zeros(shape=(self.size, steps, *feature_shape))
-    targets = np.zeros(shape=(self.size, steps, *target_shape))
-    for i in range(self.size):
-      # Fill in features
-      sequence_i = self._sequences[i]
-      assert isinstance(sequence_i, np.ndarray)
-      c = self._cursors[i]
-      features[i] = sequence_i[c:c + steps]
-      # Fill in targets
-      target_i = self._targets[i]
-      assert isinstance(target_i, np.ndarray)
-      if len(target_i) == 1:
-        targets[i] = np.tile(target_i, (steps, 1))
-      else:
-        assert len(target_i) == len(sequence_i)
-        targets[i] = target_i[c:c + steps]
-
-      # Move cursor
-      assert 0 < c + steps <= len(sequence_i)
-      self._cursors[i] += steps
+    assert steps > 0
+
+    # Get flat indices of samples to emit, shape = [size, steps]
+    lanes = self._slots
+    starts = lanes * self._capacity + self._cursors[lanes]
+    indices = starts[:, np.newaxis] + np.arange(steps)
+    # Gather features and targets
+    features = self._gather(self._x_lanes, indices, 'features')
+    targets = self._gather(self._y_lanes, indices, 'targets')
+
+    # Move cursors and ring buffer cursor
+    self._cursors[lanes] += steps
+    self._buffer_cursor = (self._buffer_cursor + 1) % self._buffer_num
 
     # Return features and targets
     return features, targets
 
   @staticmethod
   def get_round_length(batch_size, num_steps, lengths, len_f=None):
+    """Calculate the number of batches a parallel engine will emit given
+       sequence lengths. Instead of simulating the engine, this method tracks
+       the finish time of each lane in a heap, thus costs O(n log batch_size)
+       time where n is the number of sequences.
+    """
+    checker.check_positive_integer(batch_size)
+    checker.check_type(num_steps, int)
     checker.check_type(lengths, int)
-    pe = ParallelEngine(batch_size)
-    round_len, cursor = 0, 0
-
-    while True:
-      # Set sequences and targets if necessary
-      while not pe.is_ready:
+    if len_f is not None: lengths = [len_f(l) for l in lengths]
+
+    # Lanes are loaded in order, each with a finish time
+    finish_times = list(lengths[:batch_size])
+    heapq.heapify(finish_times)
+    round_len, cursor, time = 0, min(batch_size, len(lengths)), 0
+
+    while len(finish_times) > 0:
+      # Emit until the earliest lane is exhausted
+      next_time = finish_times[0]
+      if next_time > time:
+        if num_steps < 0: round_len += 1
+        else: round_len += int(np.ceil((next_time - time) / num_steps))
+        time = next_time
+      # Load new sequences into exhausted lanes or shut them down
+      while len(finish_times) > 0 and finish_times[0] == time:
         if cursor < len(lengths):
-          length = lengths[cursor] if len_f is None else len_f(lengths[cursor])
-          x = np.zeros(shape=(length, 1))
-          y = x
+          heapq.heapreplace(finish_times, time + lengths[cursor])
           cursor += 1
-        else: x, y = None, None
-        pe.set_sequence(x, y)
-
-      if pe.flameout: break
-      pe.emit(num_steps)
-      round_len += 1
+        else: heapq.heappop(finish_times)
 
     return round_len
 
@@ -137,4 +203,3 @@ if __name__ == '__main__':
   print('>> Calculating ...')
   print('>> round_len = {}'.format(
     ParallelEngine.get_round_length(batch_size, num_steps, lengths)))
-
@@ -0,0 +1,140 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from tframe import checker
+from tframe import hub
+from tframe import pedia
+from tframe.data.base_classes import TFRData
+from tframe.data.bigdata import BigData
+
+
+class PipelineBatch(object):
+  """A data batch whose features and targets are provided by a tf.data
+     iterator inside graph. Only the switch of the pipeline will be fed"""
+  features = None
+  targets = None
+
+  def __init__(self, size):
+    self.size = size
+    self.data_dict = {DataPipeline.SWITCH: True}
+
+
+class DataPipeline(object):
+  """DataPipeline wraps TFRData for feed-forward models as tf.data pipelines
+     which share a reinitializable iterator. Files of BigData are loaded (and
+     initialized by init_f) in parallel, while other data are read from their
+     batch generators. Batches are prefetched and optionally cached.
+
+     Placeholders created by DataPipeline take the next element of the
+     iterator as default values. Feeding them as usual, e.g., during
+     validation, leaves the iterator untouched. The iterator is advanced only
+     when the switch placeholder is fed with True, as PipelineBatch does, so
+     that evaluating these placeholders elsewhere without feeding them
+     raises an error instead of consuming an element.
+  """
+  KEYS = (pedia.features, pedia.targets)
+  SWITCH = 'pipeline_switch'
+
+  def __init__(self, features_dtype, targets_dtype):
+    self._dtypes = (features_dtype, targets_dtype)
+    # {(data_set id, batch_size, shuffle): (data_set, initializer)}
+    self._initializers = {}
+    with tf.name_scope('Pipeline'):
+      self._iterator = tf.data.Iterator.from_structure(
+        self._dtypes, (tf.TensorShape(None),) * 2)
+      self._switch = tf.placeholder_with_default(False, [], name=self.SWITCH)
+      tf.add_to_collection(pedia.default_feed_dict, self._switch)
+      self._next = dict(zip(self.KEYS, tf.cond(
+        self._switch, lambda: tuple(self._iterator.get_next()),
+        self._get_unfed_element)))
+
+  # region : Public Methods
+
+  def placeholder(self, dtype, shape, name, key):
+    """Create a placeholder which by default takes data[key] of the next
+       element produced by iterator
+    :param key: \in {pedia.features, pedia.targets}
+    """
+    assert key in self.KEYS
+    assert dtype == self._dtypes[self.KEYS.index(key)]
+    return tf.placeholder_with_default(self._next[key], shape, name=name)
+
+  def gen_batches(self, session, data_set, batch_size, shuffle=False):
+    """Initialize iterator with data_set and generate a PipelineBatch for
+       each element to be produced"""
+    assert isinstance(session, tf.Session)
+    round_len = data_set.get_round_length(batch_size)
+    if round_len is None: raise AssertionError(
+      '!! Round length of {} can not be determined'.format(data_set.name))
+    session.run(self._get_initializer(data_set, batch_size, shuffle))
+    for _ in range(round_len): yield PipelineBatch(batch_size)
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _get_unfed_element(self):
+    """Raise an error when placeholders are evaluated without being fed
+       while the pipeline is switched off"""
+    assert_op = tf.Assert(False, [
+      '!! Placeholders of data pipeline should be fed outside pipeline'])
+    with tf.control_dependencies([assert_op]):
+      return tuple(tf.zeros([0], dtype) for dtype in self._dtypes)
+
+  def _get_initializer(self, data_set, batch_size, shuffle):
+    key = (id(data_set), batch_size, shuffle)
+    # Data set is kept along with its initializer so that its id will not be
+    # .. reused by another object
+    entry = self._initializers.get(key, None)
+    if entry is None or entry[0] is not data_set:
+      with tf.name_scope('Pipeline'):
+        entry = (data_set, self._iterator.make_initializer(
+          self._make_dataset(data_set, batch_size, shuffle)))
+      self._initializers[key] = entry
+    return entry[1]
+
+  def _make_dataset(self, data_set, batch_size, shuffle):
+    assert isinstance(data_set, TFRData)
+    checker.check_positive_integer(batch_size)
+    if isinstance(data_set, BigData):
+      dataset = self._make_big_dataset(data_set, batch_size, shuffle)
+    else:
+      # Batches of data in memory are only sliced thus are read sequentially,
+      # .. i.e., hub.num_parallel_calls and hub.pipeline_cache apply to
+      # .. BigData only
+      def generator():
+        for batch in data_set.gen_batches(batch_size, shuffle):
+          yield batch.features, batch.targets
+      dataset = tf.data.Dataset.from_generator(generator, self._dtypes)
+    return dataset.prefetch(max(hub.prefetch_depth, 1))
+
+  def _make_big_dataset(self, data_set, batch_size, shuffle):
+    """Files are loaded and initialized in parallel. Loaded arrays may be
+       cached so that files will be read only once"""
+    assert isinstance(data_set, BigData)
+    np_dtypes = [dtype.as_numpy_dtype for dtype in self._dtypes]
+    def load(file_name):
+      stack = data_set._load_and_check(file_name.decode()).stack
+      return [np.asarray(array, dtype=dtype) for array, dtype in zip(
+        (stack.features, stack.targets), np_dtypes)]
+
+    file_names = list(data_set.files.keys())
+    dataset = tf.data.Dataset.from_tensor_slices(file_names).map(
+      lambda f: tuple(tf.py_func(load, [f], self._dtypes)),
+      num_parallel_calls=hub.num_parallel_calls)
+    if hub.pipeline_cache is not None:
+      dataset = dataset.cache(hub.pipeline_cache)
+    if shuffle: dataset = dataset.shuffle(len(file_names))
+
+    # Batches are extracted file by file as BigData.gen_batches does
+    def split(x, y):
+      samples = tf.data.Dataset.from_tensor_slices((x, y))
+      if shuffle: samples = samples.shuffle(tf.cast(tf.shape(x)[0], tf.int64))
+      return samples.batch(batch_size)
+    return dataset.flat_map(split)
+
+  # endregion : Private Methods
@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+
+from six.moves import queue
+
+from tframe import checker
+
+
+class Prefetcher(object):
+  """Prefetcher wraps a batch generator (usually produced by
+     TFRData.gen_batches or TFRData.gen_rnn_batches) and fills a bounded
+     queue with batches on a background thread, so that batch assembly can be
+     overlapped with session.run in the main thread.
+
+     Batches are handed out in exactly the same order as they are produced,
+     which is required by RNN training with states carried between batches.
+  """
+  _END = object()
+
+  def __init__(self, batches, depth=2):
+    """
+    :param batches: an iterable of data batches
+    :param depth: max number of batches waiting in queue
+    """
+    self._batches = batches
+    self._depth = checker.check_positive_integer(depth, 'prefetch depth')
+    self._queue = queue.Queue(maxsize=self._depth)
+    self._stop_event = threading.Event()
+    self._thread = None
+    self._error = None
+
+  # region : Properties
+
+  @property
+  def depth(self):
+    return self._depth
+
+  @property
+  def alive(self):
+    return self._thread is not None and self._thread.is_alive()
+
+  # endregion : Properties
+
+  # region : Overriden Methods
+
+  def __iter__(self):
+    self.start()
+    try:
+      while True:
+        batch = self._queue.get()
+        if batch is self._END: break
+        yield batch
+      # Re-raise the exception raised in worker thread if necessary
+      if self._error is not None: raise self._error
+    finally: self.stop()
+
+  # endregion : Overriden Methods
+
+  # region : Public Methods
+
+  def start(self):
+    if self._thread is not None:
+      raise AssertionError('!! Prefetcher can only be started once')
+    self._thread = threading.Thread(target=self._fill, name='Prefetcher')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop worker thread. Batches left in queue will be abandoned"""
+    self._stop_event.set()
+    # Make room for worker thread in case it is blocked by a full queue
+    while self.alive:
+      try: self._queue.get_nowait()
+      except queue.Empty: pass
+      self._thread.join(0.01)
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _put(self, item):
+    """Put item into queue, return False if prefetcher has been stopped"""
+    while not self._stop_event.is_set():
+      try:
+        self._queue.put(item, timeout=0.1)
+        return True
+      except queue.Full: continue
+    return False
+
+  def _fill(self):
+    try:
+      for batch in self._batches:
+        if not self._put(batch): return
+    except Exception as e:
+      self._error = e
+    self._put(self._END)
+
+  # endregion : Private Methods
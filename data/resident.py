@@ -0,0 +1,121 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import tensorflow as tf
+
+from tframe import checker
+from tframe import pedia
+from tframe.data.dataset import DataSet
+
+
+class ResidentBatch(object):
+  """A data batch whose features and targets stay inside graph. Only the
+     position of this batch will be fed"""
+  features = None
+  targets = None
+
+  def __init__(self, start, size):
+    self.size = size
+    self.data_dict = {ResidentData.START: start, ResidentData.SIZE: size}
+
+
+class ResidentData(object):
+  """ResidentData keeps features and targets of a regular DataSet in graph
+     variables once uploaded. Data batches are then gathered inside graph
+     according to an index order which is shuffled inside graph as well, so
+     that only the start index and size of each batch will be fed.
+
+     Placeholders created by ResidentData take batches gathered from resident
+     data as default values. Feeding them as usual, e.g., during validation,
+     bypasses resident data.
+  """
+  START = 'resident_start'
+  SIZE = 'resident_size'
+
+  def __init__(self):
+    self._data_set = None
+    # {key: (variable placeholder, upload op)}
+    self._uploads = {}
+
+    with tf.name_scope('Resident'):
+      self._start = tf.placeholder_with_default(0, [], name=self.START)
+      self._size = tf.placeholder_with_default(0, [], name=self.SIZE)
+      tf.add_to_collection(pedia.default_feed_dict, self._start)
+      tf.add_to_collection(pedia.default_feed_dict, self._size)
+
+      # Order of samples in current round
+      self._order = self._get_variable(tf.int32, 1, 'order')
+      self._length = tf.placeholder(tf.int32, [], name='length')
+      self._arrange_op = tf.assign(
+        self._order, tf.range(self._length), validate_shape=False)
+      self._shuffle_op = tf.assign(
+        self._order, tf.random_shuffle(tf.range(self._length)),
+        validate_shape=False)
+      self._indices = self._order[self._start:self._start + self._size]
+
+  # region : Properties
+
+  @property
+  def data_set(self):
+    return self._data_set
+
+  # endregion : Properties
+
+  # region : Public Methods
+
+  def placeholder(self, dtype, shape, name, key):
+    """Create a placeholder which by default takes the batch gathered from
+       resident data[key]
+    :param key: \in {pedia.features, pedia.targets}
+    """
+    assert key in (pedia.features, pedia.targets)
+    with tf.name_scope('Resident'):
+      data = self._get_variable(dtype, len(shape), '{}_data'.format(key))
+      upload_ph = tf.placeholder(dtype, name='{}_upload'.format(key))
+      upload_op = tf.assign(data, upload_ph, validate_shape=False)
+      self._uploads[key] = (upload_ph, upload_op)
+      batch = tf.gather(data, self._indices)
+    return tf.placeholder_with_default(batch, shape, name=name)
+
+  def upload(self, session, data_set):
+    """Upload features and targets of data_set into graph"""
+    assert isinstance(session, tf.Session)
+    if not isinstance(data_set, DataSet) or not data_set.is_regular_array:
+      raise TypeError('!! Only regular DataSet can be uploaded')
+    ops, feed_dict = [], {}
+    for key, (upload_ph, upload_op) in self._uploads.items():
+      array = data_set[key]
+      if array is None: raise ValueError('!! {} not found'.format(key))
+      ops.append(upload_op)
+      feed_dict[upload_ph] = array
+    session.run(ops, feed_dict=feed_dict)
+    self._data_set = data_set
+
+  def gen_batches(self, session, batch_size, shuffle=False):
+    """Generate resident batches of the data set uploaded. Samples are
+       reordered at the beginning of each round"""
+    if self._data_set is None: raise AssertionError('!! No data uploaded')
+    checker.check_positive_integer(batch_size)
+    size = self._data_set.size
+    op = self._shuffle_op if shuffle else self._arrange_op
+    session.run(op, feed_dict={self._length: size})
+    for i in range(self._data_set.get_round_length(batch_size)):
+      start = i * batch_size
+      yield ResidentBatch(start, min(batch_size, size - start))
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  @staticmethod
+  def _get_variable(dtype, rank, name):
+    """Get a variable whose shape can be changed by assigning. Variables
+       created here will not be saved"""
+    var = tf.Variable(tf.zeros([0] * rank, dtype=dtype), trainable=False,
+                      validate_shape=False, name=name)
+    tf.add_to_collection(pedia.do_not_save, var)
+    return var
+
+  # endregion : Private Methods
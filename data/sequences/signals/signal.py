@@ -110,15 +110,27 @@ class Signal(np.ndarray):
 
   # region : Public Methods
 
-  def causal_matrix(self, memory_depth, skip_head=False):
+  def causal_matrix(self, memory_depth, skip_head=False, view=False):
+    """Get a matrix of shape (N, D) whose i-th row is [x_{i-D+1}, ..., x_i],
+       where N is the length of this signal, D is the memory depth, and x_j is
+       regarded as 0 for j < 0. If skip_head is True, the first D - 1 rows
+       will be skipped.
+
+       The matrix is built as a sliding window view over the signal (padded if
+       necessary). If view is True, this read-only view is returned directly
+       so that memory usage will not be multiplied by D.
+    """
     checker.check_positive_integer(memory_depth)
     assert isinstance(self, np.ndarray)
     if memory_depth == 1: return np.reshape(self, (-1, 1))
-    N, D = self.size, memory_depth
-    x = np.append(np.zeros(shape=(D - 1,)), self)
-    matrix = np.zeros(shape=(N, D))
-    for i in range(N): matrix[i] = x[i:i+D]
-    return matrix[D - 1:] if skip_head else matrix
+    D = memory_depth
+    x = np.asarray(self)
+    if not skip_head:
+      x = np.concatenate((np.zeros(shape=(D - 1,), dtype=x.dtype), x))
+    matrix = np.lib.stride_tricks.as_strided(
+      x, shape=(max(len(x) - D + 1, 0), D), strides=(x.strides[0],) * 2,
+      writeable=False)
+    return matrix if view else np.array(matrix)
 
   def auto_correlation(self, lags, keep_dim=False):
     if isinstance(lags, int):
@@ -85,9 +85,11 @@ class SignalSet(DataSet):
   # region : Public Methods
 
   def init_features_and_targets(self, targets_key=None, memory_depth=None,
-                                skip_head=True):
+                                skip_head=True, view=False):
     """Initialize features and targets using data in data_dict.
-        After initialization, data_dict will be cleared"""
+        After initialization, data_dict will be cleared.
+        If view is True, features will be read-only views of signals, see
+        Signal.causal_matrix"""
     # If target key is not provided, try to find one in data_dict
     if targets_key is None:
       targets_candidates = None
@@ -110,7 +112,7 @@ class SignalSet(DataSet):
     for i, signal in enumerate(self.signals):
       # Append signal to features
       assert isinstance(signal, Signal)
-      features.append(signal.causal_matrix(memory_depth, skip_head))
+      features.append(signal.causal_matrix(memory_depth, skip_head, view))
       # Append target
       if targets_candidates is not None:
         target = targets_candidates[i]
@@ -182,30 +184,41 @@ class SignalSet(DataSet):
   # region : Public Static Methods
 
   @staticmethod
-  def chop_with_stride(x, y, size, stride, rand_shift=True):
+  def chop_with_stride(x, y, size, stride, rand_shift=True, lazy=False):
+    """Chop a 1-D sequence x into windows of the given size with the given
+       stride. If rand_shift is True, windows will be shifted by a random
+       offset within the remainder.
+       If len(y) == len(x), the target of each window is y at the last step of
+       the window. Otherwise y must be a sequence label which will be
+       repeated for each window.
+       If lazy is True, x windows (and repeated labels) are returned as
+       read-only views, which will only be materialized when copied
+       (e.g., into parallel engine lanes).
+    """
     assert isinstance(x, np.ndarray) and isinstance(y, np.ndarray)
     checker.check_type([size, stride], int)
 
     out_len = SignalSet.chop_with_stride_len_f(len(x), size, stride)
-    x_out = np.zeros(shape=(out_len, size))
-    y_out = np.zeros(shape=(out_len, *y.shape[1:]))
-
     if rand_shift:
       remain = len(x) - ((out_len - 1) * stride + size)
       shift = np.random.randint(remain + 1)
     else: shift = 0
-    for i in range(out_len):
-      # Fill in x
-      x_out[i] = x[shift + stride * i:shift + stride * i + size]
-      # Fill in y if necessary
-      if len(x) == len(y):
-        y_out[i] = y[shift + stride * i:shift + stride * i + size]
-
-    if len(x) != len(y):
+
+    # Get window views of x
+    per_step_targets = len(y) == len(x)
+    x = np.asarray(x)[shift:]
+    x_out = np.lib.stride_tricks.as_strided(
+      x, shape=(out_len, size), strides=(stride * x.strides[0], x.strides[0]),
+      writeable=False)
+    # Get targets
+    if per_step_targets:
+      y_out = y[shift + size - 1:shift + size - 1 + stride * out_len:stride]
+    else:
       assert len(y) == 1
-      y = np.tile(y, (out_len, 1))
+      y_out = np.broadcast_to(y, (out_len, *y.shape[1:]))
 
-    return x_out, y
+    if lazy: return x_out, y_out
+    return np.array(x_out), np.array(y_out)
 
   @staticmethod
   def chop_with_stride_len_f(length, size, stride):
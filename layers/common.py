@@ -223,6 +223,8 @@ class Input(Layer):
     self.dtype = hub.dtype if dtype is None else dtype
     self.name = name
     self.place_holder = None
+    # If set, placeholder will by default take batches provided by source
+    self.source = None
 
     self.set_group_shape(group_shape)
 
@@ -245,7 +247,10 @@ class Input(Layer):
     # This method is only accessible by Function.__call__ thus a None will
     #   be given as input
     assert len(args) == 0 and len(kwargs) == 0
-    input_ = tf.placeholder(
+    if self.source is not None:
+      input_ = self.source.placeholder(
+        self.dtype, self.input_shape, self.name, pedia.features)
+    else: input_ = tf.placeholder(
       dtype=self.dtype, shape=self.input_shape, name=self.name)
     # Update neuron scale
     self.neuron_scale = get_scale(input_)
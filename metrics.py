@@ -38,7 +38,9 @@ def accuracy(labels, outputs):
 
 def generalized_accuracy(truth, output):
   """This metric is first designed for ERG data set, for whom models are
-     built always have outputs with shape [1, string_len, symbol_number]"""
+     built always have outputs with shape [1, string_len, symbol_number].
+     Valid steps of masked outputs with shape [num_steps, symbol_number]
+     are also accepted"""
   # Sanity check
   assert isinstance(truth, tf.Tensor) and isinstance(output, tf.Tensor)
   truth_shape = truth.shape.as_list()
@@ -46,16 +48,17 @@ def generalized_accuracy(truth, output):
 
   # Assert batch size is 1
   # assert truth_shape[0] == output_shape[0] == 1
-  assert len(truth_shape) == len(output_shape) == 3
+  assert len(truth_shape) == len(output_shape) and len(truth_shape) in (2, 3)
   # truth = tf.reshape(truth, truth_shape[1:])
   # output = tf.reshape(output, output_shape[1:])
 
   # Compare distribution
   # TODO: consider tf.nn.top_k or something
+  # .. along symbol axis for both accepted shapes
   tf_sort = lambda val: tf.contrib.framework.sort(
-    val, axis=1, direction='DESCENDING')
-  alpha = tf.reduce_sum(tf.multiply(truth, output), axis=2)
-  beta = tf.reduce_sum(tf.multiply(tf_sort(truth), tf_sort(output)), axis=2)
+    val, axis=-1, direction='DESCENDING')
+  alpha = tf.reduce_sum(tf.multiply(truth, output), axis=-1)
+  beta = tf.reduce_sum(tf.multiply(tf_sort(truth), tf_sort(output)), axis=-1)
   return tf.reduce_mean(tf.cast(tf.equal(alpha, beta), tf.float32))
 
 
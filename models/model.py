@@ -2,9 +2,13 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
+import weakref
 import tensorflow as tf
 import numpy as np
 
+from operator import attrgetter
+
 import tframe as tfr
 from tframe import DataSet
 from tframe import hub
@@ -57,12 +61,29 @@ class Model(object):
     self._update_group = Group(
       self, self._loss, self._metric, self._train_step,
       self._train_step_summary, name='Update-group')
+    # Running several optimizer steps in a single session call
+    self._fused_step = NestedTensorSlot(self, 'Fused-step')
 
     # Private attributes
     self._default_net = None
     self._optimizer = None
+    # Variables to be trained, None for all trainable variables
+    self._var_list = None
     self._built = False
     self._scheme = None
+    self._feed_plan = None
+    # Size of default feed dict collection when feed plan was compiled
+    self._feed_plan_size = 0
+    # Feed plan may be used by several threads, e.g., in shadow validation
+    self._feed_plan_lock = threading.Lock()
+    self._fused_steps = 1
+    self._fused_feeds = None
+    self._fused_slots = None
+    self._resident = None
+    self._pipeline = None
+    # (weakref(data), batch_size, [(feed_dict, weight), ...]) of the data set
+    # .. validated with cache on, e.g., validation set of a trainer
+    self._val_feeds = None
 
     # Public attributes
     self.counter = None
@@ -101,6 +122,11 @@ class Model(object):
     assert isinstance(self._train_step, OperationSlot)
     return self._train_step
 
+  @property
+  def fused_steps(self):
+    """Number of optimizer steps run in one call of update_model_fused"""
+    return self._fused_steps
+
   @property
   def built(self):
     assert isinstance(self._built, bool)
@@ -141,8 +167,12 @@ class Model(object):
   def build(self, optimizer=None, **kwargs):
     # Smooth out flags before important actions
     hub.smooth_out_conflicts()
-    #
-    self._build(optimizer=optimizer, **kwargs)
+    # Variables read inside in-graph training loops must be resource variables
+    use_resource = True if hub.fused_steps > 1 else None
+    with tf.variable_scope(tf.get_variable_scope(), use_resource=use_resource):
+      self._build(optimizer=optimizer, **kwargs)
+    # Resolve placeholders to be fed once the graph is built
+    self._compile_feed_plan()
     # Initialize monitor
     self._init_monitor()
     # Set built flag
@@ -174,10 +204,89 @@ class Model(object):
       raise AssertionError('!! loss has not been activated yet')
     with tf.name_scope('Optimizer'):
       if optimizer is None: optimizer = tf.train.AdamOptimizer(1e-4)
-      self._optimizer = optimizer
-      self._train_step.plug(
+      self._optimizer, self._var_list = optimizer, var_list
+      if hub.accumulation_steps > 1:
+        self._train_step.plug(self._get_accumulation_step(
+          optimizer, var_list, hub.accumulation_steps))
+      else: self._train_step.plug(
         optimizer.minimize(self._loss.op, var_list=var_list))
 
+  def _get_accumulation_step(self, optimizer, var_list, num_steps):
+    """Get a train step which adds gradients to accumulators and applies
+       their mean once every `num_steps` runs. Accumulators and counter
+       will not be saved"""
+    checker.check_positive_integer(num_steps)
+    grads_and_vars = [(grad, var) for grad, var in optimizer.compute_gradients(
+      self._loss.op, var_list=var_list) if grad is not None]
+    with tf.name_scope('Accumulation'):
+      accumulators = [tf.Variable(
+        tf.zeros(var.shape, dtype=var.dtype.base_dtype), trainable=False,
+        name='accumulator') for _, var in grads_and_vars]
+      counter = tf.Variable(0, trainable=False, name='counter')
+      for var in accumulators + [counter]:
+        tf.add_to_collection(pedia.do_not_save, var)
+
+      accumulate_ops = [acc.assign_add(tf.convert_to_tensor(grad)) for acc, (
+        grad, _) in zip(accumulators, grads_and_vars)]
+      with tf.control_dependencies(accumulate_ops):
+        count = counter.assign_add(1)
+
+      def apply():
+        # Accumulators should be read after all gradients have been added
+        mean_grads_and_vars = [(acc.read_value() / num_steps, var) for acc, (
+          _, var) in zip(accumulators, grads_and_vars)]
+        with tf.control_dependencies(
+            [optimizer.apply_gradients(mean_grads_and_vars)]):
+          return tf.group(*[acc.assign(tf.zeros_like(acc))
+                            for acc in accumulators])
+
+      return tf.cond(tf.equal(count % num_steps, 0), apply, tf.no_op)
+
+  @with_graph
+  def _define_fused_train_step(self, step_f, slots, num_steps):
+    """Define an op running `num_steps` optimizer steps inside a while loop
+       so that several batches can be fed within a single session call.
+       Every placeholder in default feed dict collection is stacked.
+       Should be called after train step has been defined.
+    :param step_f: a function which takes a dictionary mapping each
+                   placeholder to its value of a single batch and returns a
+                   list of tensors in which the first one is the loss to be
+                   minimized
+    :param slots: slots corresponding to tensors returned by step_f
+    :param num_steps: number of optimizer steps to run
+    """
+    if not self._train_step.activated:
+      raise AssertionError('!! train step has not been defined yet')
+    checker.check_positive_integer(num_steps)
+    self._compile_feed_plan()
+    placeholders = [p for p, _ in self._feed_plan]
+    with tf.name_scope('Fused'):
+      # Stacked placeholders are not fed if none of the batches provides
+      # .. values, in which case default values are repeated
+      feeds = [tf.placeholder_with_default(
+        tf.stack([p] * num_steps), tf.TensorShape([num_steps]).concatenate(
+          p.shape), name='fused_' + p.op.name.split('/')[-1])
+        for p in placeholders]
+
+      def body(i, *sums):
+        tensors = step_f({p: tf.gather(feed, i)
+                          for p, feed in zip(placeholders, feeds)})
+        # Slots of optimizer have been created in _define_train_step
+        train_op = self._optimizer.minimize(
+          tensors[0], var_list=self._var_list)
+        with tf.control_dependencies([train_op]):
+          return [i + 1] + [s + t for s, t in zip(sums, tensors)]
+
+      init_sums = [tf.zeros([], dtype=hub.dtype) for _ in slots]
+      results = tf.while_loop(
+        lambda i, *_: i < num_steps, body, [tf.constant(0)] + init_sums,
+        parallel_iterations=1, back_prop=False)
+      self._fused_step.plug([s / num_steps for s in results[1:]])
+
+    self._fused_steps = num_steps
+    self._fused_feeds = list(zip(placeholders, feeds))
+    self._fused_slots = slots
+
   def _merge_summaries(self):
     train_step_summaries = tf.get_collection(pedia.train_step_summaries)
     validation_summaries = tf.get_collection(pedia.validation_summaries)
@@ -216,6 +325,40 @@ class Model(object):
     feed_dict = self._get_default_feed_dict(data_batch, is_training=True)
     return self._update_group.run(feed_dict)
 
+  def update_model_fused(self, data_batches):
+    """Run `fused_steps` optimizer steps on a list of data batches of the
+       same size. Return losses (and metrics) averaged over these steps"""
+    if not self._fused_step.activated:
+      raise AssertionError('!! fused train step has not been defined')
+    assert len(data_batches) == self._fused_steps
+    feed_dicts = [self._get_default_feed_dict(batch, is_training=True)
+                  for batch in data_batches]
+    feed_dict = {feed: np.stack([fd[p] for fd in feed_dicts])
+                 for p, feed in self._fused_feeds if p in feed_dicts[0]}
+    feed_dict.update(self.agent.get_status_feed_dict(is_training=True))
+    return dict(zip(self._fused_slots, self._fused_step.run(feed_dict)))
+
+  def upload_data(self, data_set):
+    """Upload features and targets of a regular data set into graph so that
+       its batches can be gathered inside graph during training"""
+    if self._resident is None: raise AssertionError(
+      '!! resident_data should be set to True before model is built')
+    self._resident.upload(self.session, data_set)
+
+  def get_resident_batches(self, batch_size, shuffle=False):
+    """Get generator of data batches gathered inside graph from the data set
+       uploaded"""
+    assert self._resident is not None
+    return self._resident.gen_batches(self.session, batch_size, shuffle)
+
+  def get_pipeline_batches(self, data_set, batch_size, shuffle=False):
+    """Get generator of placeholder batches, each of which stands for a batch
+       produced by the data pipeline initialized with data_set"""
+    if self._pipeline is None: raise AssertionError(
+      '!! data_pipeline should be set to True before model is built')
+    return self._pipeline.gen_batches(
+      self.session, data_set, batch_size, shuffle)
+
   def get_data_batches(self, data_set, batch_size, num_steps=None,
                        shuffle=False):
     """ Get batch generator.
@@ -246,32 +389,29 @@ class Model(object):
     else: raise ValueError('!! Can not resolve input type of this model')
     return data_batches
 
-  def validate_model(self, data, batch_size=None, allow_sum=False):
+  def validate_model(self, data, batch_size=None, allow_sum=False,
+                     session=None, cache=False):
     """Validate model. If data provided is not regular, batch validation will
-       be used. For RNN model, batch validation requires batch size to be 1."""
+       be used. For RNN model, batch validation requires batch size to be 1.
+       Model can be validated in another session of the same graph if session
+       is provided. If cache is True, feed dicts of validation batches are
+       kept for the next validation on the same data set. Only one data set
+       is cached at a time and BigData is never cached."""
     assert isinstance(data, TFRData)
     if not data.is_regular_array and batch_size is None: batch_size = 1
     # Normal validation
     if batch_size is None:
       data = self._sanity_check_before_use(data)
       feed_dict = self._get_default_feed_dict(data, is_training=False)
-      return self._validate_group.run(feed_dict, allow_sum=allow_sum)
+      return self._validate_group.run(
+        feed_dict, allow_sum=allow_sum, session=session)
     # Batch validation: Calculate metric one by one
-    metric_list = []
-    total = 0
-    for batch in self.get_data_batches(data, batch_size, -1, False):
-      # Calculate weight
-      weight = batch.targets.shape[0]
-      if self.input_type is InputTypes.RNN_BATCH:
-        weight *= batch.targets.shape[1]
-      assert weight > 0
+    metric_sum, total = 0.0, 0
+    for feed_dict, weight in self._get_val_feeds(data, batch_size, cache):
       total += weight
-      # Validate batch
-      batch = self._sanity_check_before_use(batch)
-      feed_dict = self._get_default_feed_dict(batch, is_training=False)
-      metric_list.append(self._metric.run(feed_dict) * weight)
+      metric_sum += self._metric.run(feed_dict, session=session) * weight
     # Return metric mean
-    metric_mean = np.sum(metric_list) / total
+    metric_mean = metric_sum / total
     if allow_sum: self._batch_val_summ.write(metric_mean)
     return {self._metric: metric_mean}
 
@@ -338,24 +478,67 @@ class Model(object):
 
   # region : Private Methods
 
-  @with_graph
   def _get_default_feed_dict(self, batch, is_training):
+    # Placeholders may be added into collection after model is built
+    with self._feed_plan_lock:
+      if self._feed_plan is None or self._feed_plan_size != len(
+          self.graph.get_collection_ref(pedia.default_feed_dict)):
+        self._compile_feed_plan()
+      feed_plan = self._feed_plan
     feed_dict = {}
-    for tensor in tf.get_collection(pedia.default_feed_dict):
-      if 'input' in tensor.name.lower():
-        feed_dict[tensor] = batch[pedia.features]
-      elif 'target' in tensor.name:
-        # TODO: when predict without outputing loss ...
-        if batch.targets is not None: feed_dict[tensor] = batch.targets
-      else:
-        name = tensor.name.split('/')[-1].split(':')[0]
-        val = batch.data_dict.get(name, None)
-        if val is not None: feed_dict[tensor] = val
+    for tensor, getter in feed_plan:
+      # TODO: when predict without outputing loss ...
+      val = getter(batch)
+      if val is not None: feed_dict[tensor] = val
 
     feed_dict.update(self.agent.get_status_feed_dict(is_training))
 
     return feed_dict
 
+  def _compile_feed_plan(self):
+    """Resolve each placeholder in default feed dict collection to a field of
+       data batch. Feed plan is a list of (placeholder, getter) in which
+       getter(batch) returns the value to be fed or None"""
+    plan = []
+    collection = self.graph.get_collection(pedia.default_feed_dict)
+    for tensor in collection:
+      if 'input' in tensor.name.lower(): getter = attrgetter('features')
+      elif 'target' in tensor.name: getter = attrgetter('targets')
+      else:
+        name = tensor.name.split('/')[-1].split(':')[0]
+        getter = lambda batch, key=name: batch.data_dict.get(key, None)
+      plan.append((tensor, getter))
+    self._feed_plan, self._feed_plan_size = plan, len(collection)
+
+  def _get_val_feeds(self, data, batch_size, cache):
+    """Get feed dicts of validation batches along with their weights"""
+    entry = self._val_feeds
+    if (cache and entry is not None and entry[0]() is data
+        and entry[1] == batch_size): return entry[2]
+    cache = cache and not isinstance(data, BigData)
+    feeds = self._gen_val_feeds(data, batch_size, copy=cache)
+    if not cache: return feeds
+    feeds = list(feeds)
+    self._val_feeds = (weakref.ref(data), batch_size, feeds)
+    return feeds
+
+  def _gen_val_feeds(self, data, batch_size, copy=False):
+    for batch in self.get_data_batches(data, batch_size, -1, False):
+      # Calculate weight
+      weight = batch.targets.shape[0]
+      if self.input_type is InputTypes.RNN_BATCH:
+        weight *= batch.targets.shape[1]
+        # Only valid steps count for padded sequences
+        mask = batch.data_dict.get(pedia.mask, None)
+        if mask is not None: weight = int(np.sum(mask))
+      assert weight > 0
+      batch = self._sanity_check_before_use(batch)
+      feed_dict = self._get_default_feed_dict(batch, is_training=False)
+      # Arrays in batches may be views of buffers which will be overwritten
+      if copy: feed_dict = {k: np.array(v) if isinstance(v, np.ndarray) else v
+                            for k, v in feed_dict.items()}
+      yield feed_dict, weight
+
   def _sanity_check_before_use(self, data):
     if not isinstance(data, DataSet):
       raise TypeError('!! Input data must be an instance of TFData')
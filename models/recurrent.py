@@ -2,16 +2,19 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import numpy as np
 import tensorflow as tf
 
+from tframe import console
 from tframe import hub
+from tframe import pedia
 
 from tframe.models.model import Model
 from tframe.nets import RNet
 from tframe.layers import Input
 
 from tframe.core.decorators import with_graph
-from tframe.core import TensorSlot, NestedTensorSlot
+from tframe.core import TensorSlot, NestedTensorSlot, OperationSlot
 
 
 class Recurrent(Model, RNet):
@@ -29,6 +32,22 @@ class Recurrent(Model, RNet):
     # mascot will be initiated as a placeholder with no shape specified
     # .. and will be put into initializer argument of tf.scan
     self._mascot = None
+    # mask indicating valid steps of padded sequences, used only when
+    # .. hub.bucket_batches is on
+    self._mask = None
+    # Variables carrying states between training steps and ops updating and
+    # .. resetting them, used only when hub.state_in_graph is on
+    self._state_vars = None
+    self._state_update = OperationSlot(self, 'State-update')
+    self._reset_ops = None
+
+  # region : Properties
+
+  @property
+  def fusible(self):
+    return all([net.fusible for net in self.children if isinstance(net, RNet)])
+
+  # endregion : Properties
 
   # region : Build
 
@@ -53,15 +72,37 @@ class Recurrent(Model, RNet):
     # elems.shape = [num_steps, batch_size, *sample_shape]
     elems = tf.transpose(input_placeholder, [1, 0] + perm[2:])
 
+    # Define mask if necessary. mask.shape = [batch_size, num_steps]
+    mask = None
+    if hub.bucket_batches:
+      self._mask = tf.placeholder_with_default(
+        tf.fill(tf.shape(input_placeholder)[:2], True), [None, None],
+        name=pedia.mask)
+      tf.add_to_collection(pedia.default_feed_dict, self._mask)
+      mask = tf.transpose(self._mask)
+
+    # Keep states in graph variables if required
+    if hub.state_in_graph: self._init_state = self._define_state_variables()
+
     # Pop last softmax if necessary
     last_softmax = self.pop_last_softmax()
     # Call scan to produce a dynamic op
-    scan_outputs, state_sequences = tf.scan(
-      self, elems, initializer=(self._mascot, self.init_state), name='Scan')
+    if hub.fused_rnn and self.fusible:
+      scan_outputs, state_sequences = self._scan_layer_by_layer(elems, mask)
+    else:
+      if hub.fused_rnn: console.warning(
+        'Fused mode is not supported by all rnn cells in this model')
+      step_f = self
+      if mask is not None: elems, step_f = (elems, mask), self._masked_step
+      scan_outputs, state_sequences = tf.scan(
+        step_f, elems, initializer=(self._mascot, self.init_state),
+        name='Scan')
     # Activate state slot
     assert isinstance(self._state, NestedTensorSlot)
     self._state.plug(Recurrent._get_last_state(state_sequences))
-    self._update_group.add(self._state)
+    # If states are kept in variables, they will be updated along with train
+    # .. step, see _define_train_step
+    if self._state_vars is None: self._update_group.add(self._state)
     # Transpose scan outputs to get final outputs
     assert isinstance(scan_outputs, tf.Tensor)
     perm = list(range(len(scan_outputs.shape.as_list())))
@@ -75,6 +116,120 @@ class Recurrent(Model, RNet):
     #  Output has a shape of [batch_size, num_steps, *output_shape]
     self.outputs.plug(outputs)
 
+  @with_graph
+  def _define_train_step(self, optimizer=None, var_list=None):
+    Model._define_train_step(self, optimizer, var_list)
+    if self._state_vars is None: return
+    # Last states are written back to variables instead of being fetched.
+    # .. Variables should not be overwritten until train step has read them
+    with tf.name_scope('States'):
+      with tf.control_dependencies([self._train_step.op]):
+        self._state_update.plug(tf.group(*[
+          tf.assign(var, state, validate_shape=False) for var, state in zip(
+            self._state_vars, Recurrent._flatten(self._state.op))]))
+    self._update_group.add(self._state_update)
+
+  def _define_state_variables(self):
+    """Define a non-trainable variable for each state placeholder, along with
+       ops resetting them. Return state tensors which read these variables by
+       default and can still be fed, e.g., during validation"""
+    self._state_vars = []
+    batch_size = tf.placeholder(tf.int32, [], name='batch_size')
+    zero_lanes = tf.placeholder(tf.int32, [None], name='zero_lanes')
+    drop_lanes = tf.placeholder(tf.int32, [None], name='drop_lanes')
+    reset_ops, part_reset_ops = [], []
+
+    def define(state):
+      if isinstance(state, (list, tuple)):
+        return tuple([define(s) for s in state])
+      assert isinstance(state, tf.Tensor)
+      size = state.shape.as_list()[1]
+      var = tf.Variable(tf.zeros([0, size], dtype=state.dtype),
+                        trainable=False, validate_shape=False, name='state')
+      tf.add_to_collection(pedia.do_not_save, var)
+      self._state_vars.append(var)
+      # Reset all lanes
+      reset_ops.append(tf.assign(
+        var, tf.zeros([batch_size, size], dtype=state.dtype),
+        validate_shape=False))
+      # Reset lanes in zero_lanes and drop lanes in drop_lanes
+      value = var.read_value()
+      lanes = tf.range(tf.shape(value)[0])
+      hit = lambda indices: tf.reduce_any(
+        tf.equal(lanes[:, None], indices[None, :]), axis=1)
+      value = tf.where(hit(zero_lanes), tf.zeros_like(value), value)
+      part_reset_ops.append(tf.assign(
+        var, tf.boolean_mask(value, tf.logical_not(hit(drop_lanes))),
+        validate_shape=False))
+      return tf.placeholder_with_default(
+        var.read_value(), state.shape, name='init_state')
+
+    with tf.name_scope('States'): init_state = define(self.init_state)
+    self._reset_ops = (batch_size, tf.group(*reset_ops),
+                       zero_lanes, drop_lanes, tf.group(*part_reset_ops))
+    return init_state
+
+  def _scan_layer_by_layer(self, elems, mask=None):
+    """Run children one after another over all time steps so that input
+       projections of rnn cells can be calculated outside recurrence
+    :param elems: inputs with shape [num_steps, batch_size, *sample_shape]
+    :param mask: None or a boolean tensor with shape [num_steps, batch_size]
+    :return: outputs with shape [num_steps, batch_size, ...] and a tuple of
+             state sequences of rnn cells
+    """
+    init_states = self.init_state
+    output, state_sequences = elems, []
+    with tf.variable_scope(self.group_name, reuse=tf.AUTO_REUSE):
+      for net in self.children:
+        if not isinstance(net, RNet):
+          output = Recurrent._apply_to_all_steps(net, output)
+          continue
+        init_state = init_states[len(state_sequences)]
+        def step_f(pre_outputs, elem, net=net):
+          x_proj, valid = elem if mask is not None else (elem, None)
+          output_t, state = net._fused_link(pre_outputs[1], x_proj)
+          if valid is not None: state = Recurrent._select_states(
+            valid, state, pre_outputs[1])
+          return output_t, state
+        # Variables are created within the same scope as in step mode
+        with tf.variable_scope(net.group_name, reuse=tf.AUTO_REUSE):
+          x_proj = net._project_inputs(output)
+          h = init_state[0] if isinstance(init_state, tuple) else init_state
+          output, states = tf.scan(
+            step_f, x_proj if mask is None else (x_proj, mask),
+            initializer=(tf.zeros_like(h), init_state), name='Scan')
+        state_sequences.append(states)
+    return output, tuple(state_sequences)
+
+  @staticmethod
+  def _apply_to_all_steps(f, x):
+    """Apply a stateless function to x with shape
+       [num_steps, batch_size, ...] as if all steps were in one batch"""
+    shape = tf.shape(x)
+    y = f(tf.reshape(x, [-1] + x.shape.as_list()[2:]))
+    return tf.reshape(y, [shape[0], shape[1]] + y.shape.as_list()[1:])
+
+  def _masked_step(self, pre_outputs, elem):
+    """States are carried over padded steps"""
+    input_, valid = elem
+    output, states = self(pre_outputs, input_)
+    return output, Recurrent._select_states(valid, states, pre_outputs[1])
+
+  @staticmethod
+  def _select_states(valid, states, pre_states):
+    if isinstance(states, (list, tuple)):
+      selected = [Recurrent._select_states(valid, s, pre_s)
+                  for s, pre_s in zip(states, pre_states)]
+      return tuple(selected) if isinstance(states, tuple) else selected
+    else:
+      assert isinstance(states, tf.Tensor)
+      return tf.where(valid, states, pre_states)
+
+  @staticmethod
+  def _flatten(states):
+    if not isinstance(states, (list, tuple)): return [states]
+    return [s for obj in states for s in Recurrent._flatten(obj)]
+
   @staticmethod
   def _get_last_state(states):
     if isinstance(states, (list, tuple)):
@@ -87,6 +242,42 @@ class Recurrent(Model, RNet):
 
   # endregion: Build
 
+  # region : Public Methods
+
+  def reset_state(self, batch_size):
+    if self._state_vars is None: return RNet.reset_state(self, batch_size)
+    batch_size_ph, reset_op = self._reset_ops[:2]
+    self.session.run(reset_op, feed_dict={batch_size_ph: batch_size})
+
+  def reset_part_state(self, indices, values=None):
+    if self._state_vars is None:
+      return RNet.reset_part_state(self, indices, values)
+    assert isinstance(indices, (list, tuple))
+    indices = np.array(indices, dtype=np.int32)
+    if values is None: drop = np.zeros(len(indices), dtype=bool)
+    else: drop = np.array([v is None for v in values], dtype=bool)
+    zero_lanes, drop_lanes, part_reset_op = self._reset_ops[2:]
+    self.session.run(part_reset_op, feed_dict={
+      zero_lanes: indices[~drop], drop_lanes: indices[drop]})
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _get_state_dict(self, batch_size=None):
+    # States are read from variables during training
+    if batch_size is None and self._state_vars is not None: return {}
+    return RNet._get_state_dict(self, batch_size)
+
+  def _mask_out(self, *tensors):
+    """Keep valid steps of tensors with shape [batch_size, num_steps, ...]
+       if mask is defined. Valid steps are flattened along the first
+       dimension"""
+    if self._mask is None: return tensors
+    return tuple([tf.boolean_mask(tensor, self._mask) for tensor in tensors])
+
+  # endregion : Private Methods
+
 
 
 
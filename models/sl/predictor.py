@@ -22,6 +22,9 @@ from tframe.core import TensorSlot
 
 from tframe.trainers import TrainerHub
 from tframe.data.base_classes import TFRData
+from tframe.data.resident import ResidentData
+from tframe.data.pipeline import DataPipeline
+from tframe.nets.state_store import StateTable
 
 
 class Predictor(Feedforward, Recurrent):
@@ -41,6 +44,8 @@ class Predictor(Feedforward, Recurrent):
     net_type.__init__(self, mark)
     # Attributes
     self._targets = TensorSlot(self, 'targets')
+    # States of streams in streaming inference
+    self._streams = None
 
   # region : Properties
 
@@ -75,6 +80,13 @@ class Predictor(Feedforward, Recurrent):
   def _build(self, optimizer=None, loss='euclid',
              metric=None, metric_is_like_loss=True, metric_name='Metric',
              **kwargs):
+    # Gather input and targets from resident data or read them from data
+    # .. pipeline if required
+    if self.master is Feedforward:
+      if hub.resident_data: self.input_.source = self._resident = ResidentData()
+      elif hub.data_pipeline: self.input_.source = self._pipeline = (
+          DataPipeline(self.input_.dtype, hub.dtype))
+
     # Call parent's build method
     # Usually output tensor has been plugged into Model._outputs slot
     self.master._build(self)
@@ -90,7 +102,12 @@ class Predictor(Feedforward, Recurrent):
         output_tensor = self.logits_tensor
         assert output_tensor is not None
       else: output_tensor = self.outputs.tensor
-      loss_tensor = loss_function(self._targets.tensor, output_tensor)
+      target_tensor = self._targets.tensor
+      # Padded steps should not be taken into account
+      if self.master is Recurrent:
+        target_tensor, output_tensor = self._mask_out(
+          target_tensor, output_tensor)
+      loss_tensor = loss_function(target_tensor, output_tensor)
       # TODO: with or without regularization loss?
       if hub.summary:
         tf.add_to_collection(pedia.train_step_summaries,
@@ -105,8 +122,12 @@ class Predictor(Feedforward, Recurrent):
     if metric is not None:
       metric_function = metrics.get(metric)
       with tf.name_scope('Metric'):
-        metric_tensor = metric_function(
+        target_tensor, output_tensor = (
           self._targets.tensor, self._outputs.tensor)
+        if self.master is Recurrent:
+          target_tensor, output_tensor = self._mask_out(
+            target_tensor, output_tensor)
+        metric_tensor = metric_function(target_tensor, output_tensor)
         self._metric.plug(metric_tensor, as_loss=metric_is_like_loss,
                           symbol=metric_name)
         if hub.summary:
@@ -120,8 +141,28 @@ class Predictor(Feedforward, Recurrent):
     # Define train step
     self._define_train_step(optimizer)
 
+    # Define fused train step for feedforward predictors
+    if self.master is Feedforward and hub.fused_steps > 1:
+      def step_f(feeds):
+        # Variables are reused when net is called again
+        output, logits, reg_loss = self._relink(feeds[self.input_tensor])
+        if loss != 'cross_entropy': logits = output
+        targets = feeds[self._targets.tensor]
+        tensors = [loss_function(targets, logits)]
+        if reg_loss is not None: tensors[0] += reg_loss
+        if metric is not None:
+          tensors.append(metrics.get(metric)(targets, output))
+        return tensors
+
+      slots = [self._loss] + ([self._metric] if metric is not None else [])
+      self._define_fused_train_step(step_f, slots, hub.fused_steps)
+
   def _plug_target_in(self, shape):
-    target_tensor = tf.placeholder(hub.dtype, shape, name='targets')
+    source = self.input_.source if self.master is Feedforward else None
+    if source is not None:
+      target_tensor = source.placeholder(
+        hub.dtype, shape, 'targets', pedia.targets)
+    else: target_tensor = tf.placeholder(hub.dtype, shape, name='targets')
     self._targets.plug(target_tensor, collection=pedia.default_feed_dict)
 
   # endregion : Build
@@ -141,7 +182,8 @@ class Predictor(Feedforward, Recurrent):
     # Update recurrent model
     feed_dict = self._get_default_feed_dict(data_batch, is_training=True)
     results = self._update_group.run(feed_dict)
-    self._state_array = results.pop(self._state)
+    # States are not fetched if they are kept in graph
+    if self._state in results: self._state_array = results.pop(self._state)
     return results
 
   # endregion : Train
@@ -158,6 +200,54 @@ class Predictor(Feedforward, Recurrent):
       outputs.append(output)
     return np.concatenate(outputs)
 
+  def predict_stream(self, chunks, extractor=None):
+    """Run a chunk of steps for each stream and return the outputs. State
+       of each stream is kept between calls in a state table with at most
+       `hub.max_streams` entries so that a stream continues from where it
+       stopped. Streams with chunks of the same length are run in a single
+       session call. If the state of a stream has been evicted, a KeyError
+       will be raised before any stream is run. Such a stream should be
+       ended by end_stream and re-primed from its beginning.
+
+    :param chunks: a dictionary {stream_id: chunk} in which each chunk is an
+                    array with shape [num_steps, *sample_shape]
+    :param extractor: a function applied to outputs of each stream
+    :return: a dictionary {stream_id: outputs} in which outputs have shape
+              [num_steps, *output_shape]
+    """
+    if self.master is not Recurrent: raise TypeError(
+      '!! Streaming inference is only supported by recurrent predictors')
+    if self._streams is None: self._streams = StateTable(hub.max_streams)
+    # Check before running any stream so that no state is advanced
+    evicted = self._streams.evicted
+    evicted = [key for key in chunks if key in evicted]
+    if len(evicted) > 0: raise KeyError(
+      '!! States of streams {} have been evicted. Call end_stream and '
+      're-prime them'.format(evicted))
+    # Group streams by chunk length
+    groups = {}
+    for key, chunk in chunks.items():
+      groups.setdefault(len(chunk), []).append(key)
+
+    results = {}
+    for keys in groups.values():
+      states = self._streams.gather(keys, self._get_zero_state(1))
+      feed_dict = dict(zip(
+        Recurrent._flatten(self.init_state), Recurrent._flatten(states)))
+      feed_dict[self.input_tensor] = np.stack([chunks[key] for key in keys])
+      feed_dict.update(self.agent.get_status_feed_dict(is_training=False))
+      outputs, states = self.session.run(
+        [self._outputs.tensor, self._state.op], feed_dict=feed_dict)
+      self._streams.scatter(keys, states)
+      for key, output in zip(keys, outputs):
+        results[key] = output if extractor is None else extractor(output)
+    return results
+
+  def end_stream(self, stream_id):
+    """Drop state of a stream in streaming inference. An evicted stream can
+       be run again from zero state after being ended"""
+    if self._streams is not None: self._streams.pop(stream_id)
+
   def evaluate_model(self, data, batch_size=None, **kwargs):
     # Check metric
     if not self.metric.activated: raise AssertionError('!! Metric not defined')
@@ -315,4 +315,37 @@ class Net(Function):
 
     return get_name()
 
+  def _relink(self, input_):
+    """Call this net again on input_, e.g., inside a while loop, and return
+       (output, logits, regularization loss). Regularization losses in
+       collection are built once when variables are created, thus they are
+       rebuilt here from variables read in current context. Tensors recorded
+       during the first call are kept"""
+    records = self._get_link_records()
+    reg_losses = []
+    def getter(getter_, *args, **kwargs):
+      var = getter_(*args, **kwargs)
+      regularizer = kwargs.get('regularizer', None)
+      if regularizer is not None:
+        reg_loss = regularizer(var)
+        if reg_loss is not None: reg_losses.append(reg_loss)
+      return var
+
+    with tf.variable_scope(tf.get_variable_scope(), custom_getter=getter):
+      output = self(input_)
+    logits = self.logits_tensor
+    # Restore tensors recorded during the first call
+    for net, logits_tensor, branch_outputs in records:
+      net._logits_tensor, net.branch_outputs = logits_tensor, branch_outputs
+    reg_loss = None if len(reg_losses) == 0 else tf.add_n(reg_losses)
+    return output, logits, reg_loss
+
+  def _get_link_records(self):
+    """Return [(net, logits tensor, branch outputs)] of this net and all nets
+       inside, which will be overwritten when this net is called"""
+    records = [(self, self._logits_tensor, list(self.branch_outputs))]
+    for child in self.children:
+      if isinstance(child, Net): records += child._get_link_records()
+    return records
+
   # endregion: Private Methods
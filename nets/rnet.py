@@ -14,6 +14,9 @@ class RNet(Net):
   """Recurrent net which outputs states besides common result"""
   net_name = 'rnet'
   RECURRENT = 'RECURRENT'
+  # Whether this cell can be run in fused mode, in which input projections
+  # .. for all time steps are calculated before recurrence
+  fusible = False
 
   def __init__(self, name):
     # Call parent's constructor
@@ -22,6 +25,7 @@ class RNet(Net):
     # Attributes
     self._inter_type = self.RECURRENT
     self._state_array = None
+    # Store shared by all cells for partial state reset, used only by root
     self._state_size = None
     self._init_state = None
     self._kernel = None
@@ -110,26 +114,33 @@ class RNet(Net):
 
   def reset_part_state(self, indices, values=None):
     """This method is first designed for parallel training of RNN model with
-        irregular sequence input"""
+        irregular sequence input. Lanes with value 0 are reset to zero in
+        place while those with value None are dropped"""
     assert isinstance(indices, (list, tuple))
     assert self.is_root
 
     # Separate indices
-    if values is None: values = [0] * len(indices)
-    zero_indices = [i for i, v in zip(indices, values) if v is not None]
-    none_indices = [i for i in indices if i not in zero_indices]
-    assert len(zero_indices) + len(none_indices) == len(indices)
+    indices = np.array(indices, dtype=int)
+    if values is None: drop = np.zeros(len(indices), dtype=bool)
+    else: drop = np.array([v is None for v in values], dtype=bool)
+    zero_lanes, drop_lanes = indices[~drop], indices[drop]
+
+    # Remaining lanes are selected by a mask shared by states of all cells
+    active = None
+    if len(drop_lanes) > 0:
+      state = self._state_array
+      while isinstance(state, (list, tuple)): state = state[0]
+      active = np.ones(len(state), dtype=bool)
+      active[drop_lanes] = False
 
     def _reset(state):
       if isinstance(state, np.ndarray):
-        if len(zero_indices) > 0: state[np.array(zero_indices), :] = 0
-        if len(none_indices) > 0: state = np.delete(state, none_indices, axis=0)
+        if len(zero_lanes) > 0: state[zero_lanes] = 0
+        if active is not None: state = np.compress(active, state, axis=0)
         return state
       elif isinstance(state, (list, tuple)):
         # tf.scan returns a list of states
-        state = list(state)
-        for i, s in enumerate(state): state[i] = _reset(s)
-        return tuple(state)
+        return tuple([_reset(s) for s in state])
       else:
         raise TypeError('!! Unknown type of states: {}'.format(type(state)))
 
@@ -209,6 +220,37 @@ class RNet(Net):
     b = self._get_bias(b_name, weight_shape[1]) if use_bias else None
     return W, b
 
+  def _project_inputs(self, x):
+    """Project inputs of all time steps at once in fused mode. Should be
+       called within variable scope of this cell
+    :param x: inputs with shape [num_steps, batch_size, input_size]
+    :return: projections with shape [num_steps, batch_size, ...]
+    """
+    raise NotImplementedError('!! {} is not fusible'.format(self.net_name))
+
+  def _fused_link(self, pre_state, x_proj):
+    """Link a time step in fused mode given the input projection of this
+       step. Should return (output, state)"""
+    raise NotImplementedError('!! {} is not fusible'.format(self.net_name))
+
+  def _split_kernel(self, x, W, input_first=True):
+    """Split W into input kernel and recurrent kernel, and project x of all
+       time steps with the input kernel
+    :param x: inputs with shape [num_steps, batch_size, input_size]
+    :param W: kernel applied to concatenated input and state
+    :param input_first: whether input precedes state in concatenation
+    :return: projections of x with shape [num_steps, batch_size, W.shape[1]]
+             and the recurrent kernel
+    """
+    input_size = x.shape.as_list()[-1]
+    if input_first: W_x, W_s = W[:input_size], W[input_size:]
+    else: W_x, W_s = W[self._state_size:], W[:self._state_size]
+    shape = tf.shape(x)
+    x_proj = tf.reshape(
+      tf.matmul(tf.reshape(x, [-1, input_size]), W_x),
+      [shape[0], shape[1], W.shape.as_list()[1]])
+    return x_proj, W_s
+
   def _net(self, x, W, b):
     return tf.nn.bias_add(tf.matmul(x, W), b)
 
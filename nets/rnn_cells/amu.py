@@ -100,6 +100,7 @@ class AMU(RNet):
 class PAMU(BasicRNNCell):
   """Practical AMU"""
   net_name = 'pamu'
+  fusible = False
 
   # region : Properties
 
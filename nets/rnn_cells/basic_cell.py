@@ -16,6 +16,7 @@ class BasicRNNCell(RNet):
      TODO: Temporarily defined as a net
   """
   net_name = 'basic_cell'
+  fusible = True
 
   def __init__(
       self,
@@ -65,5 +66,21 @@ class BasicRNNCell(RNet):
     self._kernel, self._bias = W, bias
     return state, state
 
+  def _project_inputs(self, x):
+    input_size = x.shape.as_list()[-1]
+    bias = None
+    if self._use_bias: bias = self._get_bias('b', self._state_size)
+    W = self._get_variable(
+      'W', [self._state_size + input_size, self._state_size])
+    x_proj, self._recurrent_kernel = self._split_kernel(x, W)
+    if bias is not None: x_proj = tf.add(x_proj, bias)
+
+    self._kernel, self._bias = W, bias
+    return x_proj
+
+  def _fused_link(self, pre_state, x_proj):
+    net = tf.add(x_proj, tf.matmul(pre_state, self._recurrent_kernel))
+    state = self._activation(net, name='state')
+    return state, state
 
 
@@ -40,4 +40,40 @@ class GRU(BasicRNNCell):
     self._bias = (brz, bs)
     return new_s, new_s
 
+  def _project_inputs(self, x):
+    """Inputs are projected for r, z gates and candidates at once"""
+    input_size = x.shape.as_list()[-1]
+    brz, bs = None, None
+    Wrz = self._get_variable(
+      'Wrz', [self._state_size + input_size, 2 * self._state_size])
+    if self._use_bias: brz = self._get_bias('brz', 2 * self._state_size)
+    Ws = self._get_variable(
+      'Ws', [self._state_size + input_size, self._state_size])
+    if self._use_bias: bs = self._get_bias('bs', self._state_size)
+    x_proj, W_s = self._split_kernel(
+      x, tf.concat([Wrz, Ws], axis=1), input_first=False)
+    if self._use_bias: x_proj = tf.add(x_proj, tf.concat([brz, bs], axis=0))
+    self._recurrent_kernel = tf.split(
+      W_s, num_or_size_splits=[2 * self._state_size, self._state_size], axis=1)
+
+    self._kernel = (Wrz, Ws)
+    self._bias = (brz, bs)
+    return x_proj
+
+  def _fused_link(self, s, x_proj):
+    Wrz_s, Ws_s = self._recurrent_kernel
+    x_rz, x_s = tf.split(
+      x_proj, num_or_size_splits=[2 * self._state_size, self._state_size],
+      axis=1)
+    # r gate and z gate
+    rz = tf.sigmoid(tf.add(x_rz, tf.matmul(s, Wrz_s)))
+    r, z = tf.split(rz, num_or_size_splits=2, axis=1)
+    # - Read
+    with tf.name_scope('read'): s_w = tf.multiply(r, s)
+    # - Calculate candidates to write
+    s_bar = self._activation(tf.add(x_s, tf.matmul(s_w, Ws_s)))
+    with tf.name_scope('write'):
+      new_s = tf.add(tf.multiply(z, s), tf.multiply(tf.subtract(1., z), s_bar))
+    return new_s, new_s
+
 
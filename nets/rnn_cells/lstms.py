@@ -56,6 +56,10 @@ class BasicLSTMCell(RNet):
 
   # region : Properties
 
+  @property
+  def fusible(self):
+    return not self._with_peepholes
+
   def structure_string(self, detail=True, scale=True):
     gates = '[{}{}{}g{}]'.format('i' if self._input_gate else '',
                                  'f' if self._forget_gate else '',
@@ -113,6 +117,11 @@ class BasicLSTMCell(RNet):
     gate_inputs = tf.matmul(tf.concat([x, h], axis=1), W)
     if self._use_bias: gate_inputs = tf.nn.bias_add(gate_inputs, bias)
 
+    self._kernel, self._bias = W, bias
+    return self._activate_gates(gate_inputs, c)
+
+  def _activate_gates(self, gate_inputs, c):
+    size_splits = 1 + self._input_gate + self._output_gate + self._forget_gate
     # i = input_gate, g = new_input, f = forget_gate, o = output_gate
     i, f, o = (None,) * 3
     splits = list(tf.split(gate_inputs, num_or_size_splits=size_splits, axis=1))
@@ -139,9 +148,29 @@ class BasicLSTMCell(RNet):
         new_h = tf.multiply(o, new_h)
     assert len(splits) == 0
 
-    self._kernel, self._bias = W, bias
     return new_h, new_c
 
+  def _project_inputs(self, x):
+    input_size = x.shape.as_list()[-1]
+    size_splits = 1 + self._input_gate + self._output_gate + self._forget_gate
+    dim = self._state_size * size_splits
+
+    bias = None
+    if self._use_bias: bias = self._get_bias('b', dim)
+    W = self._get_variable('W', [self._state_size + input_size, dim])
+    x_proj, self._recurrent_kernel = self._split_kernel(x, W)
+    if bias is not None: x_proj = tf.add(x_proj, bias)
+
+    self._kernel, self._bias = W, bias
+    return x_proj
+
+  def _fused_link(self, pre_states, x_proj):
+    """Gates are calculated with a single matmul on h_{t-1}"""
+    h, c = pre_states
+    gate_inputs = tf.add(x_proj, tf.matmul(h, self._recurrent_kernel))
+    new_h, new_c = self._activate_gates(gate_inputs, c)
+    return new_h, (new_h, new_c)
+
   def _link_with_peepholes(self, x, h, c):
     input_size = self._get_external_shape(x)
     Wi, Wf, W, Wo = (None,) * 4
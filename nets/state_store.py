@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import collections
+
+
+class StateTable(object):
+  """StateTable keeps states of streams in streaming inference, each with a
+     batch size of 1. When the table is full, the state of the least
+     recently used stream is evicted. Ids of evicted streams are remembered
+     until they are popped so that an evicted stream will not silently
+     restart from zero state."""
+
+  def __init__(self, capacity):
+    assert isinstance(capacity, int) and capacity > 0
+    self._capacity = capacity
+    self._states = collections.OrderedDict()
+    self._evicted = set()
+
+  # region : Overriden Methods
+
+  def __contains__(self, key):
+    return key in self._states
+
+  def __len__(self):
+    return len(self._states)
+
+  # endregion : Overriden Methods
+
+  # region : Public Methods
+
+  @property
+  def evicted(self):
+    return frozenset(self._evicted)
+
+  def gather(self, keys, zero_state):
+    """Stack states of streams along the batch dimension. New streams start
+       from zero_state while evicted streams should be popped before being
+       gathered again"""
+    evicted = [key for key in keys if key in self._evicted]
+    if len(evicted) > 0: raise KeyError(
+      '!! States of streams {} have been evicted'.format(evicted))
+    states = []
+    for key in keys:
+      if key in self._states: self._states.move_to_end(key)
+      states.append(self._states.get(key, zero_state))
+    return self._merge(states)
+
+  def scatter(self, keys, states):
+    """Split batched states and put them into table"""
+    for i, key in enumerate(keys):
+      self._states[key] = self._take(states, i)
+      self._states.move_to_end(key)
+    while len(self._states) > self._capacity:
+      self._evicted.add(self._states.popitem(last=False)[0])
+
+  def pop(self, key):
+    self._evicted.discard(key)
+    return self._states.pop(key, None)
+
+  def clear(self):
+    self._states.clear()
+    self._evicted.clear()
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _merge(self, states):
+    if isinstance(states[0], np.ndarray): return np.concatenate(states, axis=0)
+    return tuple([self._merge(list(parts)) for parts in zip(*states)])
+
+  def _take(self, states, i):
+    if isinstance(states, np.ndarray): return states[i:i + 1].copy()
+    return tuple([self._take(s, i) for s in states])
+
+  # endregion : Private Methods
@@ -24,6 +24,8 @@ keep_prob = 'keep_prob'
 labels = 'labels'
 linear = 'linear'
 
+mask = 'mask'
+
 train_step_summaries = 'train_step_summaries '
 
 metric_name = 'metric_name'
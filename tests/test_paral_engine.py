@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from tframe.data.paral_engine import ParallelEngine
+
+
+# region : Reference implementations
+
+def _emit_all(engine, sequences, targets, num_steps):
+  """Drive an engine through all sequences and collect emitted blocks"""
+  blocks, cursor = [], 0
+  while True:
+    while not engine.is_ready:
+      if cursor < len(sequences):
+        x, y = sequences[cursor], targets[cursor]
+        cursor += 1
+      else: x, y = None, None
+      engine.set_sequence(x, y)
+    if engine.flameout: break
+    features, targets_ = engine.emit(num_steps)
+    blocks.append((features.copy(), targets_.copy()))
+  return blocks
+
+
+def _reference_emit_all(sequences, targets, batch_size, num_steps):
+  """Emission of the list-based engine preceding lane arrays"""
+  lanes, blocks, cursor = [None] * batch_size, [], 0
+  while True:
+    # Load sequences into exhausted lanes or shut them down
+    i = 0
+    while i < len(lanes):
+      if lanes[i] is not None and len(lanes[i][0]) - lanes[i][2] > 0:
+        i += 1
+        continue
+      if cursor < len(sequences):
+        lanes[i] = [sequences[cursor], targets[cursor], 0]
+        cursor += 1
+        i += 1
+      else: lanes.pop(i)
+    if len(lanes) == 0: break
+    max_len = min([len(x) - c for x, _, c in lanes])
+    steps = max_len if num_steps < 0 else min(max_len, num_steps)
+    features, targets_ = [], []
+    for lane in lanes:
+      x, y, c = lane
+      features.append(x[c:c + steps])
+      targets_.append(np.repeat(y, steps, axis=0) if len(y) == 1
+                      else y[c:c + steps])
+      lane[2] += steps
+    blocks.append((np.stack(features), np.stack(targets_)))
+  return blocks
+
+
+def _reference_round_length(batch_size, num_steps, lengths):
+  sequences = [np.zeros((l, 1)) for l in lengths]
+  return len(_reference_emit_all(sequences, sequences, batch_size, num_steps))
+
+# endregion : Reference implementations
+
+
+@pytest.mark.parametrize('batch_size, num_steps, buffer_num', [
+  (1, 5, 1), (3, 4, 1), (3, -1, 2), (4, 7, 3), (8, 3, 1)])
+def test_emit_matches_reference(batch_size, num_steps, buffer_num):
+  rng = np.random.RandomState(0)
+  lengths = rng.randint(1, 30, size=11)
+  sequences = [rng.randn(l, 2).astype(np.float32) for l in lengths]
+  # Mix sequence labels and step-wise targets
+  targets = [rng.randn(1 if i % 2 else l, 3).astype(np.float32)
+             for i, l in enumerate(lengths)]
+  engine = ParallelEngine(batch_size, buffer_num=buffer_num)
+  blocks = _emit_all(engine, sequences, targets, num_steps)
+  expected = _reference_emit_all(sequences, targets, batch_size, num_steps)
+  assert len(blocks) == len(expected)
+  for (x, y), (x_ref, y_ref) in zip(blocks, expected):
+    np.testing.assert_array_equal(x, x_ref)
+    np.testing.assert_array_equal(y, y_ref)
+
+
+def test_emit_rejects_mismatched_lanes():
+  engine = ParallelEngine(2)
+  engine.set_sequence(np.zeros((3, 2), np.float32), np.zeros((1, 1)))
+  with pytest.raises(TypeError):
+    engine.set_sequence(np.zeros((3, 2), np.float64), np.zeros((1, 1)))
+  with pytest.raises(ValueError):
+    engine.set_sequence(np.zeros((3, 4), np.float32), np.zeros((1, 1)))
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 3, 5, 16])
+@pytest.mark.parametrize('num_steps', [-1, 1, 4, 28])
+def test_round_length_matches_simulation(batch_size, num_steps):
+  rng = np.random.RandomState(batch_size)
+  for _ in range(5):
+    lengths = rng.randint(1, 40, size=rng.randint(1, 20)).tolist()
+    assert ParallelEngine.get_round_length(
+      batch_size, num_steps, lengths) == _reference_round_length(
+      batch_size, num_steps, lengths)
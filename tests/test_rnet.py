@@ -0,0 +1,109 @@
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from tframe.nets.rnet import RNet
+
+
+# region : Reference implementations
+
+def _reference_reset(state, indices, values=None):
+  """Per-array reset of RNet.reset_part_state with np.delete"""
+  if values is None: values = [0] * len(indices)
+  zero_indices = [i for i, v in zip(indices, values) if v is not None]
+  none_indices = [i for i in indices if i not in zero_indices]
+
+  def _reset(state):
+    if isinstance(state, np.ndarray):
+      if len(zero_indices) > 0: state[np.array(zero_indices), :] = 0
+      if len(none_indices) > 0: state = np.delete(state, none_indices, axis=0)
+      return state
+    return tuple([_reset(s) for s in state])
+
+  return _reset(state)
+
+
+def _reset(state, indices, values=None):
+  net = types.SimpleNamespace(is_root=True, _state_array=state)
+  RNet.reset_part_state(net, indices, values)
+  return net._state_array
+
+
+def _random_states(batch_size, seed=0):
+  rng = np.random.RandomState(seed)
+  rand = lambda size, dtype=np.float32: rng.randn(
+    batch_size, size).astype(dtype)
+  # e.g. an LSTM cell, a GRU cell and a float64 cell
+  return ((rand(4), rand(4)), rand(3), (rand(2, np.float64),))
+
+
+def _copy(state):
+  if isinstance(state, np.ndarray): return state.copy()
+  return tuple([_copy(s) for s in state])
+
+
+def _flatten(state):
+  if isinstance(state, np.ndarray): return [state]
+  return [a for s in state for a in _flatten(s)]
+
+
+def _assert_equal(state, expected):
+  assert isinstance(state, tuple) == isinstance(expected, tuple)
+  if isinstance(expected, tuple):
+    assert len(state) == len(expected)
+    for s, e in zip(state, expected): _assert_equal(s, e)
+    return
+  assert state.dtype == expected.dtype
+  np.testing.assert_array_equal(state, expected)
+
+# endregion : Reference implementations
+
+
+@pytest.mark.parametrize('indices, values', [
+  ([1, 3], None),
+  ([0, 2, 5], [0, None, 0]),
+  ([4, 1], [None, None]),
+  ([], None),
+  ([0, 1, 2, 3, 4, 5], [None, 0, None, 0, None, 0]),
+])
+def test_reset_matches_reference(indices, values):
+  state = _random_states(6)
+  expected = _reference_reset(_copy(state), indices, values)
+  _assert_equal(_reset(state, indices, values), expected)
+
+
+def test_consecutive_resets_match_reference():
+  rng = np.random.RandomState(1)
+  state = _random_states(8)
+  expected = _copy(state)
+  for step in range(6):
+    size = len(_flatten(state)[0])
+    indices = rng.choice(size, rng.randint(0, min(3, size) + 1),
+                         replace=False).tolist()
+    values = [None if rng.rand() < 0.5 else 0 for _ in indices]
+    expected = _reference_reset(expected, indices, values)
+    state = _reset(state, indices, values)
+    _assert_equal(state, expected)
+    # Session returns fresh arrays in the next step
+    state = _copy(state)
+    expected = _copy(expected)
+
+
+def test_zero_only_reset_is_in_place():
+  state = _random_states(5)
+  arrays = _flatten(state)
+  result = _reset(state, [0, 3])
+  for array, new_array in zip(arrays, _flatten(result)):
+    assert new_array is array
+    assert not np.any(array[[0, 3]])
+
+
+def test_dropped_states_are_contiguous():
+  state = _random_states(5)
+  result = _reset(state, [1, 2], [None, 0])
+  for array in _flatten(result):
+    assert array.shape[0] == 4
+    assert array.flags['C_CONTIGUOUS']
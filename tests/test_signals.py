@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from tframe.data.sequences.signals.signal import Signal
+from tframe.data.sequences.signals.signal_set import SignalSet
+
+
+# region : Reference implementations
+
+def _reference_causal_matrix(x, memory_depth, skip_head=False):
+  if memory_depth == 1: return np.reshape(x, (-1, 1))
+  N, D = x.size, memory_depth
+  x = np.append(np.zeros(shape=(D - 1,)), x)
+  matrix = np.zeros(shape=(N, D))
+  for i in range(N): matrix[i] = x[i:i+D]
+  return matrix[D - 1:] if skip_head else matrix
+
+
+def _reference_chop_with_stride(x, y, size, stride, rand_shift=True):
+  """Row-by-row chopping preceding strided windows, for sequence labels"""
+  out_len = SignalSet.chop_with_stride_len_f(len(x), size, stride)
+  x_out = np.zeros(shape=(out_len, size))
+  if rand_shift:
+    remain = len(x) - ((out_len - 1) * stride + size)
+    shift = np.random.randint(remain + 1)
+  else: shift = 0
+  for i in range(out_len):
+    x_out[i] = x[shift + stride * i:shift + stride * i + size]
+  assert len(y) == 1
+  return x_out, np.tile(y, (out_len, 1))
+
+# endregion : Reference implementations
+
+
+@pytest.mark.parametrize('memory_depth', [1, 2, 5, 40])
+@pytest.mark.parametrize('skip_head', [False, True])
+@pytest.mark.parametrize('view', [False, True])
+def test_causal_matrix_matches_reference(memory_depth, skip_head, view):
+  signal = Signal(np.random.RandomState(0).randn(37), fs=100)
+  matrix = signal.causal_matrix(memory_depth, skip_head, view=view)
+  np.testing.assert_array_equal(
+    matrix, _reference_causal_matrix(signal, memory_depth, skip_head))
+
+
+def test_causal_matrix_view_is_read_only():
+  signal = Signal(np.arange(10, dtype=np.float64), fs=1)
+  matrix = signal.causal_matrix(3, view=True)
+  assert not matrix.flags.writeable
+  assert signal.causal_matrix(3).flags.writeable
+
+
+@pytest.mark.parametrize('size, stride', [(1, 1), (4, 1), (5, 3), (8, 8)])
+@pytest.mark.parametrize('rand_shift', [False, True])
+@pytest.mark.parametrize('lazy', [False, True])
+def test_chop_with_stride_matches_reference(size, stride, rand_shift, lazy):
+  rng = np.random.RandomState(size)
+  x, y = rng.randn(50), rng.randn(1, 3)
+  np.random.seed(stride)
+  x_out, y_out = SignalSet.chop_with_stride(
+    x, y, size, stride, rand_shift, lazy=lazy)
+  np.random.seed(stride)
+  x_ref, y_ref = _reference_chop_with_stride(x, y, size, stride, rand_shift)
+  np.testing.assert_array_equal(x_out, x_ref)
+  np.testing.assert_array_equal(y_out, y_ref)
+
+
+def test_chop_with_stride_takes_last_step_targets():
+  x = np.arange(20, dtype=np.float64)
+  x_out, y_out = SignalSet.chop_with_stride(
+    x, x * 10, size=6, stride=4, rand_shift=False)
+  np.testing.assert_array_equal(y_out, x_out[:, -1] * 10)
+
+
+def test_columnar_signal_set_keeps_signal_attributes(tmp_path):
+  rng = np.random.RandomState(0)
+  signals = [Signal(rng.randn(l), fs=100) for l in (7, 12)]
+  responses = [Signal(rng.randn(l), fs=100) for l in (7, 12)]
+  noises = [Signal(rng.randn(l), fs=50) for l in (3, 5)]
+  signal_set = SignalSet(signals, responses, data_dict={'noises': noises})
+  filename = str(tmp_path / 'signals')
+  signal_set.save(filename, columnar=True)
+
+  loaded = SignalSet.load(filename + '.' + SignalSet.EXTENSION)
+  for key, expected in (('signals', signals), ('responses', responses),
+                        ('noises', noises)):
+    arrays = loaded.data_dict[key]
+    assert isinstance(arrays, list) and len(arrays) == len(expected)
+    for array, signal in zip(arrays, expected):
+      assert isinstance(array, Signal) and array.fs == signal.fs
+      np.testing.assert_array_equal(array, signal)
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64, np.int64])
+@pytest.mark.parametrize('skip_head', [False, True])
+def test_causal_matrix_keeps_dtype(dtype, skip_head):
+  signal = Signal(np.arange(10).astype(dtype), fs=1)
+  assert signal.causal_matrix(3, skip_head).dtype == dtype
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from tframe.nets.state_store import StateTable
+
+
+# region : Reference implementations
+
+def _zero_state():
+  return ((np.zeros((1, 3)), np.zeros((1, 3))), np.zeros((1, 2)))
+
+
+def _step(state, x):
+  """A toy recurrent step applied to states with any batch size"""
+  (c, h), g = state
+  return ((c + x, h * 0.5 + x), g - x[:, :2])
+
+
+def _merge(states):
+  if isinstance(states[0], np.ndarray): return np.concatenate(states, axis=0)
+  return tuple([_merge(list(parts)) for parts in zip(*states)])
+
+
+def _assert_equal(state, expected):
+  if isinstance(expected, tuple):
+    assert isinstance(state, tuple) and len(state) == len(expected)
+    for s, e in zip(state, expected): _assert_equal(s, e)
+  else: np.testing.assert_array_equal(state, expected)
+
+# endregion : Reference implementations
+
+
+def test_batched_streams_match_separate_runs():
+  table, rng = StateTable(capacity=8), np.random.RandomState(0)
+  # Each stream run on its own with a batch size of 1
+  expected = {}
+  for _ in range(5):
+    keys = list(rng.choice(6, rng.randint(1, 5), replace=False))
+    xs = rng.randn(len(keys), 3)
+    states = _step(table.gather(keys, _zero_state()), xs)
+    table.scatter(keys, states)
+    for i, key in enumerate(keys):
+      expected[key] = _step(expected.get(key, _zero_state()), xs[i:i + 1])
+  for key, state in expected.items():
+    _assert_equal(table.gather([key], _zero_state()), state)
+
+
+def test_gather_stacks_states_in_key_order():
+  table = StateTable(capacity=4)
+  states = [_step(_zero_state(), np.full((1, 3), i, dtype=float))
+            for i in range(3)]
+  for i, state in enumerate(states): table.scatter([i], state)
+  _assert_equal(table.gather([2, 0, 1], _zero_state()),
+                _merge([states[2], states[0], states[1]]))
+
+
+def test_least_recently_used_stream_is_evicted():
+  table = StateTable(capacity=2)
+  table.scatter(['a'], _zero_state())
+  table.scatter(['b'], _zero_state())
+  # Gathering 'a' makes 'b' the least recently used one
+  table.gather(['a'], _zero_state())
+  table.scatter(['c'], _zero_state())
+  assert len(table) == 2 and 'a' in table and 'b' not in table
+  assert table.evicted == {'b'}
+
+
+def test_evicted_stream_raises_until_popped():
+  table = StateTable(capacity=1)
+  table.scatter([0], _zero_state())
+  table.scatter([1], _zero_state())
+  with pytest.raises(KeyError): table.gather([1, 0], _zero_state())
+  table.pop(0)
+  assert len(table.evicted) == 0
+  _assert_equal(table.gather([0], _zero_state()), _zero_state())
+
+
+def test_clear_forgets_evicted_streams():
+  table = StateTable(capacity=1)
+  table.scatter([0, 1], _merge([_zero_state(), _zero_state()]))
+  assert table.evicted == {0}
+  table.clear()
+  assert len(table) == 0 and len(table.evicted) == 0
@@ -0,0 +1,260 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import pickle
+import threading
+import multiprocessing
+import numpy as np
+
+import tensorflow as tf
+import tframe as tfr
+
+from tframe import checker
+from tframe import console
+from tframe.config import Flag
+from tframe.core.mirror import VariableMirror
+
+
+class WeightExchanger(object):
+  """WeightExchanger exchanges trainable variables among copies of a model
+     living in different processes through shared memory.
+
+     In synchronous mode, each worker writes its variables into its own slot
+     and then all workers load the average of all slots. In asynchronous mode,
+     each worker adds what its variables have changed since the last exchange
+     into the global slot under a lock and then loads the global slot.
+  """
+
+  def __init__(self, num_workers, size, dtype, sync, context):
+    self.sync = sync
+    self._num_workers = num_workers
+    self._size = size
+    # Values are exchanged in a dtype which can hold all variables
+    self._dtype = np.dtype(dtype)
+    # Slot 0 holds global variables while slot i + 1 holds those of worker i
+    self._buffer = context.RawArray(
+      'b', (num_workers + 1) * size * self._dtype.itemsize)
+    self._lock = context.Lock()
+    self._barrier = context.Barrier(num_workers)
+    self._stop = context.RawValue('i', 0)
+    self._failed = context.RawValue('i', -1)
+
+    # Attributes set in the process joining in
+    self._slots = None
+    self._session = None
+    self._mirror = None
+    self._shapes = None
+    self._last = None
+
+  # region : Properties
+
+  @property
+  def stopped(self):
+    return self._stop.value == 1
+
+  # endregion : Properties
+
+  # region : Public Methods
+
+  @staticmethod
+  def get_variables(model):
+    return model.graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES)
+
+  @staticmethod
+  def get_dtype(variables):
+    return np.result_type(
+      *[var.dtype.base_dtype.as_numpy_dtype for var in variables])
+
+  def join_in(self, model, publish=False):
+    """Wait for all workers to join in. Variables of the model are published
+       as initial variables if `publish` is True, otherwise variables
+       published will be loaded into the model"""
+    self._bind(model)
+    if publish: self._slots[0] = self._get_values()
+    self._wait()
+    self._last = self._slots[0].copy()
+    if not publish: self._set_values(self._last)
+
+  def exchange(self, rank):
+    """Exchange variables and return True if workers should stop"""
+    self._check_failure()
+    values = self._get_values()
+    if self.sync:
+      self._slots[rank + 1] = values
+      self._wait()
+      values = np.mean(self._slots[1:], axis=0).astype(self._dtype)
+      # The stop flag is read between the two barriers so that all parties
+      # .. make the same decision in the same exchange
+      stopped = self.stopped
+      # Slots should not be overwritten until all workers have read them
+      self._wait()
+    else:
+      with self._lock:
+        self._slots[0] += values - self._last
+        values = self._slots[0].copy()
+      stopped = self.stopped
+    self._set_values(values)
+    self._last = values
+    return stopped
+
+  def stop(self):
+    self._stop.value = 1
+
+  def fail(self, rank):
+    self._failed.value = rank
+    self._barrier.abort()
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _bind(self, model):
+    assert isinstance(model, tfr.models.Model)
+    variables = self.get_variables(model)
+    self._shapes = [var.shape.as_list() for var in variables]
+    if sum([var.shape.num_elements() for var in variables]) != self._size:
+      raise ValueError('!! Trainable variables of model copies do not match')
+    if self.get_dtype(variables) != self._dtype: raise TypeError(
+      '!! Variable dtypes of model copies do not match')
+    with model.graph.as_default(), tf.name_scope('Exchanger'):
+      self._mirror = VariableMirror(model.graph, variables)
+    self._session = model.session
+    self._slots = np.frombuffer(self._buffer, dtype=self._dtype).reshape(
+      self._num_workers + 1, self._size)
+
+  def _get_values(self):
+    return np.concatenate([np.ravel(val).astype(self._dtype)
+                           for val in self._mirror.snapshot(self._session)])
+
+  def _set_values(self, values):
+    sizes = [int(np.prod(shape)) for shape in self._shapes]
+    self._mirror.load(self._session, [
+      np.reshape(val, shape) for val, shape in zip(
+        np.split(values, np.cumsum(sizes)[:-1]), self._shapes)])
+
+  def _wait(self):
+    try: self._barrier.wait()
+    except threading.BrokenBarrierError:
+      self._check_failure()
+      raise
+
+  def _check_failure(self):
+    if self._failed.value < 0: return
+    raise RuntimeError('!! Worker {} failed'.format(self._failed.value))
+
+  # endregion : Private Methods
+
+
+class WorkerPool(object):
+  """WorkerPool trains a model data-parallelly on CPU cores. Training set is
+     split into `num_workers` disjoint shards. The first shard is left to the
+     trainer in main process while each of the others is trained on in a
+     worker process by a copy of the model built by `th.model(th)`. Copies
+     of the model exchange their trainable variables every `exchange_cycle`
+     steps.
+
+     Worker processes are spawned, thus functions and data passed to them
+     must be picklable and the main script should be guarded by
+     `if __name__ == '__main__'`.
+  """
+
+  def __init__(self, th, model, training_set):
+    checker.check_positive_integer(th.num_workers, 'num_workers')
+    checker.check_positive_integer(th.exchange_cycle, 'exchange_cycle')
+    if not callable(th.model): raise ValueError(
+      '!! th.model should be a function which returns a built model')
+    if not hasattr(training_set, 'shard'): raise TypeError(
+      '!! {} can not be split into shards'.format(training_set.name))
+    shards = [training_set.shard(i, th.num_workers)
+              for i in range(th.num_workers)]
+    self.shard = shards[0]
+    # Processes share CPU cores. Sessions created afterwards in main process
+    # .. are also limited
+    if th.intra_op_threads == 0: th.intra_op_threads = max(
+      1, multiprocessing.cpu_count() // th.num_workers)
+    tfr.hub.intra_op_threads = th.intra_op_threads
+
+    context = multiprocessing.get_context('spawn')
+    variables = WeightExchanger.get_variables(model)
+    size = sum([var.shape.num_elements() for var in variables])
+    self._exchanger = WeightExchanger(
+      th.num_workers, size, WeightExchanger.get_dtype(variables),
+      th.sync_workers, context)
+    flag_values = self._get_flag_values(th)
+    self._processes = [
+      context.Process(target=_work, daemon=True, args=(
+        rank, type(th), flag_values, shard, self._exchanger))
+      for rank, shard in enumerate(shards[1:], 1)]
+    for process in self._processes: process.start()
+
+  # region : Public Methods
+
+  def join_in(self, model):
+    """Publish variables of the model in main process to all workers"""
+    self._exchanger.join_in(model, publish=True)
+
+  def exchange(self):
+    self._exchanger.exchange(0)
+
+  def shutdown(self, timeout=60):
+    """Stop all workers after a last exchange. Workers which have not
+       stopped within timeout seconds will be terminated"""
+    self._exchanger.stop()
+    self._exchanger.exchange(0)
+    for process in self._processes:
+      process.join(timeout)
+      if not process.is_alive(): continue
+      console.warning('Worker {} failed to stop and was terminated'.format(
+        process.name))
+      process.terminate()
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  @staticmethod
+  def _get_flag_values(th):
+    """Get values of flags which can be passed to worker processes"""
+    flag_values = {}
+    for cls in type(th).__mro__:
+      for name, attr in vars(cls).items():
+        if not isinstance(attr, Flag) or name in flag_values: continue
+        value = getattr(th, name)
+        try: pickle.dumps(value)
+        except Exception: continue
+        flag_values[name] = value
+    return flag_values
+
+  # endregion : Private Methods
+
+
+def _work(rank, hub_class, flag_values, data_set, exchanger):
+  """Entry of worker processes"""
+  from tframe.trainers.trainer import Trainer
+  try:
+    # Values passed via command line have been included in flag_values
+    if not tf.flags.FLAGS.is_parsed(): tf.flags.FLAGS(sys.argv[:1])
+    th = hub_class(as_global=True)
+    for name, value in flag_values.items(): setattr(th, name, value)
+    # Saving, logging and showing are left to main process
+    th.overwrite = True
+    for name in ('save_model', 'summary', 'snapshot', 'export_note',
+                 'progress_bar', 'hp_tuning'): setattr(th, name, False)
+
+    model = th.model(th)
+    model.launch_model()
+    if th.resident_data: model.upload_data(data_set)
+    trainer = Trainer(model, training_set=data_set)
+    trainer.th, th.trainer = th, trainer
+    exchanger.join_in(model)
+
+    with model.session.as_default():
+      while True:
+        for _ in trainer.gen_updates():
+          if not trainer.is_due(th.exchange_cycle): continue
+          if exchanger.exchange(rank): return
+  except:
+    exchanger.fail(rank)
+    raise
@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+import tframe as tfr
+
+from concurrent import futures
+
+from tframe.core.mirror import VariableMirror
+
+
+class ShadowValidator(object):
+  """ShadowValidator validates a model on a shadow session of the model's
+     graph in a background thread so that training can go on. Before each
+     validation, current variables in the main session are copied into the
+     shadow session. At most one validation runs at a time."""
+
+  def __init__(self, model):
+    assert isinstance(model, tfr.models.Model)
+    self._model = model
+    self._session = None
+    self._mirror = None
+    self._executor = None
+    self._future = None
+    # (rnd, counter) of the validation running
+    self._tag = None
+
+  # region : Properties
+
+  @property
+  def session(self):
+    assert isinstance(self._session, tf.Session)
+    return self._session
+
+  @property
+  def busy(self):
+    return self._future is not None
+
+  # endregion : Properties
+
+  # region : Public Methods
+
+  def submit(self, data, batch_size, rnd, counter, allow_sum=False):
+    """Copy current variables into shadow session and start validation"""
+    assert not self.busy
+    if self._session is None: self._launch()
+    values = self._mirror.snapshot(self._model.session)
+    self._tag = (rnd, counter)
+    self._future = self._executor.submit(
+      self._validate, values, data, batch_size, allow_sum)
+
+  def poll(self, wait=False):
+    """Return (metric_dict, rnd, counter) if the validation running has
+       finished, otherwise None. Block until it finishes if wait is True"""
+    if not self.busy: return None
+    if not wait and not self._future.done(): return None
+    metric_dict = self._future.result()
+    self._future = None
+    return (metric_dict,) + self._tag
+
+  def save_model(self):
+    """Save variables validated most recently. Should be called before
+       next submission"""
+    assert not self.busy
+    self._model.agent.save_model(self.session, self._tag[1])
+
+  def shutdown(self):
+    if self._executor is not None: self._executor.shutdown()
+    if self._session is not None: self._session.close()
+
+  # endregion : Public Methods
+
+  # region : Private Methods
+
+  def _launch(self):
+    with self._model.graph.as_default():
+      self._mirror = VariableMirror(
+        self._model.graph, self._model.variable_to_save)
+      self._session = self._mirror.create_session(
+        self._model.agent.create_session)
+      # Ops used in validation should be built before validation thread
+      # .. starts since graph building is not thread-safe
+      self._model._batch_val_summ.build()
+    self._executor = futures.ThreadPoolExecutor(max_workers=1)
+
+  def _validate(self, values, data, batch_size, allow_sum):
+    self._mirror.load(self._session, values)
+    return self._model.validate_model(
+      data, batch_size, allow_sum=allow_sum, session=self._session,
+      cache=True)
+
+  # endregion : Private Methods
@@ -10,11 +10,14 @@ import tframe as tfr
 
 from tframe import console
 from tframe.data.base_classes import TFRData
+from tframe.data.prefetcher import Prefetcher
 from tframe.enums import InputTypes, SaveMode
 from tframe.core import with_graph
 from tframe.config import Config, Flag
 
 from tframe.trainers.metric import Metric
+from tframe.trainers.shadow import ShadowValidator
+from tframe.trainers.parallel import WorkerPool
 
 
 class Trainer(object):
@@ -55,6 +58,12 @@ class Trainer(object):
     # Private Attributes
     self._record_count = 0
     self._warm_up = True
+    # Number of optimizer steps run in the last model update
+    self._update_steps = 1
+    # Validator working on a shadow session for asynchronous validation
+    self._shadow = None
+    # Worker processes training on other shards of training set
+    self._pool = None
 
     # TODO
     tfr.trainer = self
@@ -122,6 +131,26 @@ class Trainer(object):
       self._check_data(validation_set, 'validation set')
       self._validation_set = validation_set
 
+  def gen_updates(self):
+    """Update model over a round of training set and yield the loss dict of
+       each update, after which counter has been increased by the number of
+       optimizer steps run"""
+    self.th.cursor = 0
+    for batches in self._gen_fused_batches():
+      # Increase iteration counter
+      self._update_steps = len(batches)
+      self.th.cursor += self._update_steps
+      self.counter += self._update_steps
+      # Update model
+      if self._update_steps == 1:
+        yield self.model.update_model(data_batch=batches[0])
+      else: yield self.model.update_model_fused(batches)
+
+  def is_due(self, cycle, shift=0):
+    """Whether (counter - shift) has reached a multiple of cycle during the
+       last model update"""
+    return np.mod(self.counter - shift, cycle) < self._update_steps
+
   # endregion : Public Methods
 
   # region : Train
@@ -136,6 +165,10 @@ class Trainer(object):
     self._check_data(), self._sanity_check(), self.th.sanity_check()
     # Check model.session
     self._check_model()
+    # Publish initial variables to workers
+    if self._pool is not None: self._pool.join_in(self.model)
+    # Upload training set into graph if required
+    if self.th.resident_data: self.model.upload_data(self.training_set)
     # Show configurations
     self._show_configurations()
     # Maybe take down some notes
@@ -159,6 +192,13 @@ class Trainer(object):
       self.th.trainer = self
     else: self.th.set_up(**kwargs)
 
+    # Launch workers and train on the first shard of training set
+    if self.th.num_workers > 1:
+      self._pool = WorkerPool(self.th, self.model, self.training_set)
+      self._training_set = self._pool.shard
+      # Main session should share CPU cores with workers as well
+      if self.model.launched: self.model.agent.recreate_session()
+
     # Get round length
     num_steps = (self.th.num_steps
                  if self.model.input_type is InputTypes.RNN_BATCH else None)
@@ -168,6 +208,13 @@ class Trainer(object):
     if self.th.validation_per_round > 0 and self.validation_set is not None:
       if self.th.round_length is not None: self.th.validate_cycle = (
           self.th.round_length // self.th.validation_per_round)
+    # Round print and validate cycles to multiples of fused steps
+    fused_steps = self.model.fused_steps
+    if fused_steps > 1:
+      for name in ('print_cycle', 'validate_cycle'):
+        cycle = getattr(self.th, name)
+        if cycle > 0: setattr(
+          self.th, name, int(np.ceil(cycle / fused_steps)) * fused_steps)
 
   def _sanity_check(self):
     """Should be overrode by subclasses"""
@@ -227,13 +274,9 @@ class Trainer(object):
   def _inner_loop(self, rnd):
     self._record_count = 0
     # Begin iteration
-    self.th.cursor = 0
-    for batch in self._gen_batches():
-      # Increase iteration counter
-      self.th.cursor += 1
-      self.counter += 1
-      # Update model
-      loss_dict = self.model.update_model(data_batch=batch)
+    for loss_dict in self.gen_updates():
+      # Exchange variables with workers
+      self._exchange_weights()
       # Print progress
       self._print_progress(rnd, loss_dict)
       # Validation
@@ -243,6 +286,8 @@ class Trainer(object):
       self._run_probe()
       # Take snapshot
       self._snapshot()
+    # Results of asynchronous validation should be taken down in this round
+    if self._shadow is not None: self._validate_model_async(rnd, flush=True)
     if self._warm_up and self._record_count < self.th.warm_up_thres:
       self._warm_up = False
 
@@ -252,10 +297,16 @@ class Trainer(object):
 
   def _end_training(self, rounds):
     if self.th.progress_bar: console.clear_line()
+    # Stop workers
+    if self._pool is not None: self._pool.shutdown()
     # If this is a hp-tuning task, write record summary
     if self.th.hp_tuning:
       assert not self.th.summary
       self.metric.write_record_summary()
+    # Shutdown shadow session
+    if self._shadow is not None: self._shadow.shutdown()
+    # Make sure all checkpoints have been written
+    self.model.agent.flush_checkpoints()
     # Flush summary
     if self.th.summary or self.th.hp_tuning:
       self.model.agent.summary_writer.flush()
@@ -298,8 +349,41 @@ class Trainer(object):
     return f
 
   def _gen_batches(self):
-    return self.model.get_data_batches(
+    if self.th.resident_data:
+      batches = self.model.get_resident_batches(
+        self.th.batch_size, self.th.shuffle)
+    elif self.th.data_pipeline:
+      # Batches are prefetched by the pipeline itself
+      return self.model.get_pipeline_batches(
+        self.training_set, self.th.batch_size, self.th.shuffle)
+    else: batches = self.model.get_data_batches(
       self.training_set, self.th.batch_size, self.th.num_steps, self.th.shuffle)
+    # Assemble batches on a background thread if required
+    if self.th.prefetch_depth > 0:
+      batches = Prefetcher(batches, self.th.prefetch_depth)
+    return batches
+
+  def _gen_fused_batches(self):
+    """Group every `fused_steps` consecutive batches of the same size into a
+       list. Batches which can not be grouped are yielded one by one"""
+    fused_steps = self.model.fused_steps
+    batches = []
+    for batch in self._gen_batches():
+      if fused_steps == 1:
+        yield [batch]
+        continue
+      if len(batches) > 0 and batch.size != batches[0].size:
+        for b in batches: yield [b]
+        batches = []
+      batches.append(batch)
+      if len(batches) == fused_steps:
+        yield batches
+        batches = []
+    for b in batches: yield [b]
+
+  def _exchange_weights(self):
+    if self._pool is None: return
+    if self.is_due(self.th.exchange_cycle): self._pool.exchange()
 
   def _advanced_strategy(self, rnd):
     """Should be overridden"""
@@ -323,7 +407,7 @@ class Trainer(object):
 
   def _print_progress(self, rnd, loss_dict):
     if loss_dict is None or self.th.print_cycle == 0: return
-    if np.mod(self.counter - 1, self.th.print_cycle) != 0: return
+    if not self.is_due(self.th.print_cycle, shift=1): return
 
     loss_string = self._dict_to_string(loss_dict)
     total_rounds = (' - ' if self.total_rounds is None else
@@ -334,18 +418,45 @@ class Trainer(object):
 
   def _run_probe(self):
     if self._probe is None or self.th.probe_cycle == 0: return False
-    if np.mod(self.counter, self.th.probe_cycle) != 0: return False
+    if not self.is_due(self.th.probe_cycle): return False
     content = self._probe(self)
     if content is None or content == '': return
     self._inter_cut(content, prompt='[Probe]', start_time=self.th.start_time)
 
   def _validate_model(self, rnd):
     if not self.th.validation_on: return False
-    if np.mod(self.counter, self.th.validate_cycle) != 0: return False
+    if self.th.async_validation: return self._validate_model_async(rnd)
+    if not self.is_due(self.th.validate_cycle): return False
 
     # Get metric
     metric_dict = self.model.validate_model(
-      self.validation_set, self.th.val_batch_size, allow_sum=self.th.summary)
+      self.validation_set, self.th.val_batch_size, allow_sum=self.th.summary,
+      cache=True)
+    return self._take_down_metric(metric_dict, rnd)
+
+  def _validate_model_async(self, rnd, flush=False):
+    """Validate model on a shadow session while training goes on. Result of
+       each validation is taken down when it arrives, tagged with the round
+       and the step it belongs to. Models with new records are saved from the
+       shadow session so that saved variables are exactly those validated.
+       Always return False since saving has been handled here."""
+    if self._shadow is None: self._shadow = ShadowValidator(self.model)
+    due = not flush and self.is_due(self.th.validate_cycle)
+    # Validations should not be skipped thus wait if a new one is due
+    result = self._shadow.poll(wait=flush or due)
+    if result is not None:
+      metric_dict, val_rnd, counter = result
+      new_record = self._take_down_metric(
+        metric_dict, val_rnd, suffix=' (step {})'.format(counter))
+      if new_record and self._save_model_when_record_appears:
+        self._shadow.save_model()
+        self._inter_cut('Model saved', prompt='[Shadow]')
+    if due: self._shadow.submit(
+      self.validation_set, self.th.val_batch_size, rnd, self.counter,
+      allow_sum=self.th.summary)
+    return False
+
+  def _take_down_metric(self, metric_dict, rnd, suffix=''):
     new_record = None
     content = ''
     attachments = []
@@ -360,6 +471,7 @@ class Trainer(object):
 
     if len(attachments) > 0:
       content = '{} ({})'.format(content, ', '.join(attachments))
+    content += suffix
     if new_record:
       content += ' <New Record>'
       self._record_count += 1
@@ -370,7 +482,7 @@ class Trainer(object):
   def _snapshot(self):
     if not self.th.snapshot: return
     if not self.th.snapshot_cycle > 0: return
-    if np.mod(self.counter - 1, self.th.snapshot_cycle) != 0: return
+    if not self.is_due(self.th.snapshot_cycle, shift=1): return
 
     fig = self._snapshot_function(self.model)
     step = self.counter if self.total_rounds is None else self.total_rounds
@@ -413,6 +525,19 @@ class TrainerHub(Config):
                         "Save mode, \in  ['naive', 'on_record']", is_key=None)
   warm_up_thres = Flag.integer(1, 'Warm up threshold', is_key=None)
   at_most_save_once_per_round = Flag.integer(False, '...')
+  async_validation = Flag.boolean(
+    False, 'Whether to validate model on a shadow session while training '
+           'goes on', is_key=None)
+  num_workers = Flag.integer(
+    1, 'Number of processes training the model on disjoint shards of '
+       'training set. th.model should be provided if this value is larger '
+       'than 1', is_key=None)
+  sync_workers = Flag.boolean(
+    True, 'Whether workers average their variables synchronously or push '
+          'their updates asynchronously', is_key=None)
+  exchange_cycle = Flag.integer(
+    10, 'Number of steps between variable exchanges among workers',
+    is_key=None)
 
   round_name = Flag.string('Epoch', 'Name of outer loop during training')
   round = Flag.integer(1, 'General concept of total outer loops, used'